@@ -1,8 +1,14 @@
-from flask import Flask
+import os
+from flask import Flask, flash, redirect, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from app.utils.db_utils import create_default_roles, create_organizational_units
-from app.utils.file_utils import create_upload_folders
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.utils.db_utils import bootstrapped_version, SEED_VERSION
+from app.utils.storage import init_storage
+from app.utils.uploads import UploadRequest
+from app.utils.sessions import init_sessions
+from app.utils.request_utils import load_form_templates
+from app.utils.compile_scheduler import init_compile_scheduler, CompileRejected
 from .models import db
 from .config import Config
 from dotenv import load_dotenv
@@ -10,12 +16,15 @@ from dotenv import load_dotenv
 def create_app(config=Config):
     app = Flask(__name__)
 
+    # Uploads are size-checked, sniffed and hashed while they are received
+    app.request_class = UploadRequest
+
     # Load config
     app.config.from_object(config)
 
     # Initialize database with app
     db.init_app(app)
-    migrate = Migrate(app, db)
+    migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(app.root_path), 'migrations'))
 
     # Register blueprints
     from app.auth import auth_bp
@@ -32,13 +41,40 @@ def create_app(config=Config):
     app.register_blueprint(manager_bp, url_prefix='/manager')
     app.register_blueprint(employee_bp, url_prefix='/employee')
 
-    # Create tables and default roles
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
+
+    # Schema and seed data come from flask bootstrap, only check that it has run
     with app.app_context():
-        db.create_all()
-        create_default_roles()
-        create_organizational_units()
+        version = bootstrapped_version()
+        db.session.remove()
+
+    if version is None or version < SEED_VERSION:
+        app.logger.warning('Database is not bootstrapped (seed version %s, expected %s), run flask bootstrap', version, SEED_VERSION)
+
+    # Parse the LaTeX form templates, limit concurrent compiles
+    load_form_templates(app)
+    init_compile_scheduler(app)
+
+    # Compiler saturated, ask the client to retry later
+    @app.errorhandler(CompileRejected)
+    def compile_rejected(error):
+        return str(error), 503, {'Retry-After': str(error.retry_after)}
+
+    # Upload over the limit: the body cannot be read again, so send the user back to the form with a message
+    @app.errorhandler(RequestEntityTooLarge)
+    def upload_too_large(error):
+        if request.method != 'POST':
+            return error
+
+        flash(f"The upload is too large, files may be at most {app.config['UPLOAD_MAX_BYTES'] // (1024 * 1024)} MB.", 'danger')
+        return redirect(request.url)
+
+    # Storage for compiled forms and signatures
+    init_storage(app)
 
-    # Create upload folders for forms/signatures
-    create_upload_folders(app.config['FORM_FOLDER'], app.config['UPLOAD_FOLDER'])
+    # Server-side sessions, the cookie only carries the session id
+    init_sessions(app)
 
     return app
\ No newline at end of file
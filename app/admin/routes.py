@@ -1,19 +1,23 @@
-from flask import render_template, redirect, url_for, flash, session
+from flask import render_template, redirect, url_for, flash
 from app.admin import admin_bp
 from app.models import User, Role, db
-from app.auth.role_required import role_required
+from app.auth.role_required import role_required, current_roles
 from app.forms import UserForm
+from app.utils.pagination import keyset_paginate
+from app.utils.db_routing import read_replica
+from sqlalchemy import func
 
 # User management dashboard
 @admin_bp.route('/users')
+@read_replica
 @role_required('admin')
 def manage_users():
-    # Get users from database
-    users = User.query.all()
+    # Get a page of users by name, unnamed users sort first
+    users = keyset_paginate(User.query, (func.coalesce(User.name, ''), User.id),
+        lambda user: (user.name or '', user.id), descending=False)
     
     # Get current user roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    roles = current_roles()
     
     return render_template('manage_users.html', users=users, logged_in=True, roles=roles)
 
@@ -46,8 +50,7 @@ def create_user():
         return redirect(url_for('admin.manage_users'))
     
     # Get current user roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    roles = current_roles()
     
     return render_template('create_user.html', form=form, logged_in=True, roles=roles)
 
@@ -70,13 +73,13 @@ def edit_user(user_id):
             if role:
                 user.roles.append(role)
 
+        user.bump_perm_version()
         db.session.commit()
         flash('User updated successfully.', 'success')
         return redirect(url_for('admin.manage_users'))
     
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get current user roles
+    roles = current_roles()
 
     return render_template('edit_user.html', form=form, user=user, logged_in=True, roles=roles)
 
@@ -96,6 +99,7 @@ def delete_user(user_id):
 def deactivate_user(user_id):
     user = User.query.get_or_404(user_id)
     user.active = False
+    user.bump_perm_version()
     db.session.commit()
     flash('User account deactivated.', 'success')
     return redirect(url_for('admin.manage_users'))
@@ -106,6 +110,7 @@ def deactivate_user(user_id):
 def activate_user(user_id):
     user = User.query.get_or_404(user_id)
     user.active = True
+    user.bump_perm_version()
     db.session.commit()
     flash('User account activated.', 'success')
     return redirect(url_for('admin.manage_users'))
\ No newline at end of file
@@ -1,6 +1,79 @@
 from functools import wraps
-from flask import request, redirect, session, url_for, flash
-from app.models import User
+from flask import request, redirect, session, url_for, flash, g, current_app
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy.orm import selectinload
+from app.models import User, db
+
+# Logged in user for this request, loaded once with roles and shared by every view
+def get_current_user():
+    if 'current_user' not in g:
+        g.current_user = None
+
+        if session.get('logged_in', False):
+            g.current_user = User.query.options(selectinload(User.roles)).filter_by(azure_id=session['user']['sub']).first()
+
+    return g.current_user
+
+def _permission_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='permissions')
+
+# Sign a compact snapshot of the user's permissions into the session
+def store_permissions(user):
+    permissions = {
+        'id': user.id,
+        'roles': sorted(role.name for role in user.roles),
+        'unit': user.unit_id,
+        'v': user.perm_version
+    }
+    session['permissions'] = _permission_serializer().dumps(permissions)
+    return permissions
+
+# Rebuild the snapshot from the database, None if the user is gone or deactivated
+def _reload_permissions():
+    session.pop('permissions', None)
+
+    user = get_current_user()
+    if not user or not user.active:
+        return None
+
+    return store_permissions(user)
+
+# Permissions of the logged in user, read from the session without a query while the snapshot is fresh
+def get_permissions():
+    if 'permissions' in g:
+        return g.permissions
+
+    serializer = _permission_serializer()
+    token = session.get('permissions')
+
+    try:
+        permissions = serializer.loads(token, max_age=current_app.config['PERMISSION_SNAPSHOT_TTL']) if token else _reload_permissions()
+    except SignatureExpired:
+        # Stale snapshot, a single version lookup decides whether it still holds
+        permissions = serializer.loads(token)
+        version = db.session.query(User.perm_version).filter_by(id=permissions['id'], active=True).scalar()
+
+        if version == permissions['v']:
+            session['permissions'] = serializer.dumps(permissions)
+        else:
+            permissions = _reload_permissions()
+    except BadSignature:
+        permissions = _reload_permissions()
+
+    g.permissions = permissions
+    return permissions
+
+# Role names of the logged in user for the navigation, from the snapshot so no User row is loaded
+def current_roles():
+    permissions = get_permissions()
+    return permissions['roles'] if permissions else []
+
+# Owner, current approver and delegate can see a request, and so can the manager of the delegate's unit
+def can_view_request(permissions, req):
+    if permissions['id'] in (req.user_id, req.current_approver_id, req.delegated_to_id):
+        return True
+
+    return bool(req.delegated_to and 'manager' in permissions['roles'] and req.delegated_to.unit_id == permissions['unit'])
 
 def role_required(*role_names):
     def decorator(f):
@@ -9,9 +82,9 @@ def role_required(*role_names):
             if not session.get('logged_in', False):
                 return redirect(url_for("auth.login", next=request.url))
 
-            user = User.query.filter_by(azure_id=session['user']['sub']).first()
+            permissions = get_permissions()
 
-            if not user or not any(user.has_role(role) for role in role_names):
+            if not permissions or not any(role in permissions['roles'] for role in role_names):
                 flash('You do not have permission to access this page', 'danger')
                 return redirect(url_for("main.home"))
 
@@ -2,6 +2,12 @@ from flask import redirect, render_template, url_for, session, flash, request, c
 from . import auth_bp
 from app.msal_config import get_msal_app
 from app.models import User, Role, OrganizationalUnit, db
+from app.auth.role_required import current_roles, store_permissions
+from app.utils.sessions import regenerate_session
+
+# Only the claims the app reads: 'sub' identifies the user, 'name' is shown in the header
+def session_user(claims):
+    return {'sub': claims['sub'], 'name': claims.get('name')}
 
 # User login
 @auth_bp.route('/login')
@@ -21,6 +27,7 @@ def get_token():
         result = app_instance.acquire_token_by_authorization_code(
             request.args['code'], current_app.config['SCOPE'], redirect_uri=current_app.config['REDIRECT_URI']
         )
+
         if "access_token" in result:
             # Get user info
             user_claims = result.get("id_token_claims")
@@ -35,8 +42,10 @@ def get_token():
                     return redirect(url_for("main.home"))
 
                 # Store user data in session
-                session['user'] = user_claims
+                regenerate_session(session)
+                session['user'] = session_user(user_claims)
                 session['logged_in'] = True
+                store_permissions(existing_user)
 
                 return redirect(url_for("main.home"))
             else:
@@ -63,8 +72,10 @@ def get_token():
                     db.session.commit()
 
                 # Store user data in session and redirect user to home
-                session['user'] = user_claims
+                regenerate_session(session)
+                session['user'] = session_user(user_claims)
                 session['logged_in'] = True
+                store_permissions(user)
                 return redirect(url_for("main.home"))
     
     return "Login failed", 401
@@ -80,8 +91,7 @@ def logout():
 def page_not_found(error):
     
     if session.get('logged_in', False):
-        user = User.query.filter_by(azure_id=session['user']['sub']).first()
-        roles = [role.name for role in user.roles]
+        roles = current_roles()
 
         return render_template('404.html', logged_in=True, roles=roles)
 
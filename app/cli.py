@@ -0,0 +1,506 @@
+import json, os, random, shutil, statistics, struct, subprocess, tempfile, time, zlib, click
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+
+# Run background PDF compile workers
+@click.command('compile-worker')
+@click.option('--concurrency', type=int, default=None, help='Number of worker threads on this node.')
+@with_appcontext
+def compile_worker_command(concurrency):
+    from app.utils.compile_queue import run_worker_pool
+
+    concurrency = concurrency or current_app.config['COMPILE_WORKERS']
+    click.echo(f'Starting {concurrency} compile worker(s)')
+    run_worker_pool(current_app._get_current_object(), concurrency)
+
+# Build the precompiled LaTeX format for every form template
+@click.command('build-formats')
+@with_appcontext
+def build_formats_command():
+    from app.utils.latex_formats import build_format
+
+    for name, template in current_app.extensions['form_templates'].items():
+        if template.preamble is None:
+            click.echo(f'{name}: no static preamble, skipped')
+            continue
+
+        fmt = build_format(template)
+        click.echo(f'{name}: {fmt}.fmt' if fmt else f'{name}: build failed')
+
+# Write a small grayscale PNG to stand in for a signature
+def _write_sample_png(path, width=200, height=60):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    rows = b''.join(b'\x00' + bytes([255 if (x + y) % 16 else 0 for x in range(width)]) for y in range(height))
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        file.write(chunk(b'IDAT', zlib.compress(rows)))
+        file.write(chunk(b'IEND', b''))
+
+# Compare compile wall time with and without the precompiled formats
+@click.command('bench-compile')
+@click.option('--runs', type=int, default=5, help='Compiles per template and mode.')
+@with_appcontext
+def bench_compile_command(runs):
+    from app.utils.latex_formats import build_format, run_pdflatex
+
+    with tempfile.TemporaryDirectory() as workdir:
+        signature = os.path.join(workdir, 'signature.png')
+        _write_sample_png(signature)
+
+        for name, template in current_app.extensions['form_templates'].items():
+            data = {field: 'yes' if field.startswith(('OPT_', 'EDIT_')) else 'Sample' for field in template.fields}
+            data['SIGNATURE'] = signature
+
+            tex_file_path = os.path.join(workdir, f'{name}.tex')
+            with open(tex_file_path, 'w') as file:
+                file.write(template.render(data))
+
+            fmt = build_format(template) if template.preamble is not None else None
+            timings = {}
+
+            for label, mode in (('plain', None), ('format', fmt)):
+                if label == 'format' and not fmt:
+                    continue
+
+                start = time.perf_counter()
+                for _ in range(runs):
+                    run_pdflatex(tex_file_path, workdir, mode)
+                timings[label] = (time.perf_counter() - start) / runs
+
+            line = f"{name}: plain {timings['plain'] * 1000:.0f} ms"
+            if 'format' in timings:
+                line += f", format {timings['format'] * 1000:.0f} ms ({timings['plain'] / timings['format']:.1f}x)"
+            else:
+                line += ", format unavailable"
+            click.echo(line)
+
+# Positions of the given words in the first page of a PDF
+def _word_positions(path, words):
+    from pypdf import PdfReader
+
+    positions = {}
+    def visitor(text, cm, tm, font_dict, font_size):
+        for word in words:
+            if word in text and word not in positions:
+                positions[word] = (tm[4] * cm[0] + tm[5] * cm[2] + cm[4], tm[4] * cm[1] + tm[5] * cm[3] + cm[5])
+
+    for page in PdfReader(path).pages:
+        page.extract_text(visitor_text=visitor)
+    return positions
+
+# Compare overlay renders against pdflatex renders of the same sample data
+@click.command('check-overlay')
+@click.option('--tolerance', type=float, default=4.0, help='Allowed distance in points between field positions.')
+@click.argument('templates', nargs=-1)
+@with_appcontext
+def check_overlay_command(tolerance, templates):
+    from app.utils.compile_scheduler import PRIORITY_SUBMIT
+    from app.utils.overlay_renderer import OVERLAY_AVAILABLE, field_kinds, render_overlay
+    from app.utils.request_utils import _compile_tex
+
+    if not OVERLAY_AVAILABLE:
+        raise click.ClickException('pypdf and reportlab are required for the overlay engine')
+
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        signature = os.path.join(workdir, 'signature.png')
+        _write_sample_png(signature)
+
+        for name, template in current_app.extensions['form_templates'].items():
+            if templates and name not in templates:
+                continue
+
+            # A distinct word for every text field, checkboxes all ticked
+            kinds = field_kinds(template)
+            data = {field: 'yes' if kinds[field] == 'checkbox' else 'X' + field.replace('_', '') for field in template.fields}
+            data['SIGNATURE'] = signature
+            words = [data[field] for field, kind in kinds.items() if kind in ('text', 'bold')]
+
+            tex_output = _compile_tex(template, data, workdir, PRIORITY_SUBMIT)
+            overlay_output = os.path.join(workdir, f'{name}-overlay.pdf')
+            if not os.path.exists(tex_output) or not render_overlay(template, data, overlay_output):
+                click.echo(f'{name}: could not render both versions')
+                failed = True
+                continue
+
+            expected = _word_positions(tex_output, words)
+            actual = _word_positions(overlay_output, words)
+            if not expected:
+                click.echo(f'{name}: no field values found in the TeX output')
+                failed = True
+                continue
+
+            worst = 0.0
+            for word, (x, y) in expected.items():
+                if word not in actual:
+                    click.echo(f'{name}: {word} missing from the overlay')
+                    failed = True
+                    continue
+
+                distance = ((actual[word][0] - x) ** 2 + (actual[word][1] - y) ** 2) ** 0.5
+                worst = max(worst, distance)
+                if distance > tolerance:
+                    click.echo(f'{name}: {word} is {distance:.1f}pt away from its TeX position')
+                    failed = True
+
+            click.echo(f'{name}: {len(expected)} fields compared, largest offset {worst:.1f}pt')
+
+    if failed:
+        raise SystemExit(1)
+
+# Fill a scratch database with synthetic users and requests for the index benchmark
+def _fill_synthetic(engine, rows, seed=42):
+    from app.models import OrganizationalUnit, Request, RequestType, User
+
+    rng = random.Random(seed)
+    units, users = 50, max(rows // 200, 100)
+    statuses = ['draft'] * 10 + ['pending'] * 30 + ['approved'] * 40 + ['rejected'] * 20
+    start = datetime(2020, 1, 1)
+
+    with engine.begin() as connection:
+        connection.execute(OrganizationalUnit.__table__.insert(), [{'id': i, 'name': f'Unit {i}'} for i in range(1, units + 1)])
+        connection.execute(User.__table__.insert(), [
+            {'id': i, 'azure_id': f'user-{i}', 'name': f'User {i}', 'active': rng.random() > 0.05, 'unit_id': rng.randint(1, units)}
+            for i in range(1, users + 1)
+        ])
+
+        for offset in range(0, rows, 10_000):
+            batch = []
+            for i in range(offset + 1, min(offset + 10_000, rows) + 1):
+                batch.append({
+                    'id': i,
+                    'user_id': rng.randint(1, users),
+                    'status': rng.choice(statuses),
+                    'time': start + timedelta(minutes=i),
+                    'request_type': rng.choice(list(RequestType)),
+                    'current_approver_id': rng.randint(1, users),
+                    'current_unit_id': rng.randint(1, units),
+                    'delegated_to_id': rng.randint(1, users) if rng.random() < 0.1 else None,
+                    'pdf_link': f'{i}.pdf',
+                    'render_status': 'ready'
+                })
+            connection.execute(Request.__table__.insert(), batch)
+
+    return units, users
+
+# The dashboard queries, with the same filters as the views
+def _dashboard_queries(units, users):
+    from sqlalchemy import func, select
+    from app.models import Request, User
+
+    requests, people = Request.__table__, User.__table__
+    user_id, unit_id = users // 2, units // 2
+
+    return {
+        'manage_requests': select(requests).where(requests.c.current_approver_id == user_id, requests.c.delegated_to_id.is_(None), requests.c.status != 'draft'),
+        'manage_requests delegated': select(requests).join(people, requests.c.delegated_to_id == people.c.id).where(people.c.unit_id == unit_id, requests.c.status != 'draft'),
+        'delegated_requests': select(requests).where(requests.c.delegated_to_id == user_id, requests.c.status != 'draft'),
+        'user_requests': select(requests).where(requests.c.user_id == user_id).order_by(requests.c.time.desc(), requests.c.id.desc()).limit(50),
+        'reports counts': select(requests.c.status, func.count()).where(requests.c.current_unit_id == unit_id).group_by(requests.c.status),
+        'reports pending': select(requests).where(requests.c.current_unit_id == unit_id, requests.c.status == 'pending').order_by(requests.c.time.desc()).limit(50),
+        'unit employees': select(people).where(people.c.unit_id == unit_id, people.c.active.is_(True)),
+    }
+
+def _explain(connection, statement):
+    sql = str(statement.compile(connection, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    return [' '.join(str(value) for value in row) for row in connection.exec_driver_sql(prefix + sql)]
+
+def _time_queries(engine, queries, runs):
+    results = {}
+    with engine.connect() as connection:
+        for name, statement in queries.items():
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                connection.execute(statement).all()
+                timings.append(time.perf_counter() - start)
+            results[name] = (statistics.median(timings), _explain(connection, statement))
+    return results
+
+# Query plans and latency of the dashboard queries with and without the workflow indexes
+@click.command('bench-indexes')
+@click.option('--rows', type=int, default=1_000_000, help='Synthetic requests to generate.')
+@click.option('--runs', type=int, default=20, help='Executions per query.')
+@click.option('--database-uri', default=None, help='Empty scratch database, defaults to a temporary SQLite file.')
+@with_appcontext
+def bench_indexes_command(rows, runs, database_uri):
+    from sqlalchemy import create_engine
+    from app.models import db
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = create_engine(database_uri or f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}")
+        db.metadata.create_all(engine)
+
+        # Drop the workflow indexes for the baseline run
+        indexes = [index for table in db.metadata.tables.values() for index in table.indexes if index.name.startswith('ix_')]
+        for index in indexes:
+            index.drop(engine)
+
+        click.echo(f'Generating {rows} requests')
+        units, users = _fill_synthetic(engine, rows)
+        queries = _dashboard_queries(units, users)
+
+        before = _time_queries(engine, queries, runs)
+
+        for index in indexes:
+            index.create(engine)
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+        after = _time_queries(engine, queries, runs)
+
+        for name in queries:
+            click.echo(f'\n{name}: {before[name][0] * 1000:.2f} ms without indexes, {after[name][0] * 1000:.2f} ms with indexes')
+            for label, (_, plan) in (('before', before[name]), ('after', after[name])):
+                for line in plan:
+                    click.echo(f'  {label}: {line}')
+
+        if database_uri:
+            db.metadata.drop_all(engine)
+        engine.dispose()
+
+# App used by the re-render worker processes, inherited through fork
+_rerender_app = None
+
+def _init_rerender_worker(nice, ionice):
+    from app.models import db
+
+    if nice:
+        os.nice(nice)
+
+    # Lowest best-effort I/O priority, inherited by pdflatex, so disk-bound live requests go first
+    if ionice and shutil.which('ionice'):
+        subprocess.run(['ionice', '-c', '2', '-n', '7', '-p', str(os.getpid())], check=False)
+
+    _rerender_app.app_context().push()
+
+    # Connections inherited from the parent must not be shared
+    db.engine.dispose(close=False)
+
+# Render one request in a worker process, returns the request id, new PDF, the form data it rendered and error
+def _rerender_request(request_id):
+    from app.models import Request, db
+    from app.utils.compile_queue import GENERATORS
+    from app.utils.compile_scheduler import PRIORITY_DRAFT
+    from app.utils.storage import get_storage
+
+    try:
+        req = db.session.get(Request, request_id)
+        form_data = req.form_data
+        pdf_link = GENERATORS[req.request_type](form_data, PRIORITY_DRAFT)
+
+        if not get_storage('forms').exists(pdf_link):
+            return request_id, None, None, 'no PDF produced'
+        return request_id, pdf_link, form_data, None
+    except Exception as e:
+        return request_id, None, None, str(e)
+    finally:
+        db.session.remove()
+
+# Last request id handled and the ids that failed, older checkpoints hold only the id
+def _read_checkpoint(path):
+    with open(path) as file:
+        content = file.read().strip()
+
+    if not content.startswith('{'):
+        return int(content or 0), set()
+
+    state = json.loads(content)
+    return state['last_id'], set(state['retry'])
+
+def _write_checkpoint(path, last_id, retry):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump({'last_id': last_id, 'retry': sorted(retry)}, file)
+    os.replace(temp_path, path)
+
+# Re-render stored PDFs after a template change
+@click.command('rerender')
+@click.option('--type', 'request_types', multiple=True, type=click.Choice(['ferpa', 'info', 'medical', 'drop']), help='Request type, may be repeated.')
+@click.option('--status', 'statuses', multiple=True, help='Request status, may be repeated.')
+@click.option('--since', type=click.DateTime(), help='Only requests submitted on or after this date.')
+@click.option('--until', type=click.DateTime(), help='Only requests submitted before this date.')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes.')
+@click.option('--batch-size', type=int, default=50, help='Requests per database commit.')
+@click.option('--rate', type=float, default=0, help='Maximum renders per second, 0 for no limit.')
+@click.option('--nice', type=int, default=10, help='Niceness of the worker processes.')
+@click.option('--ionice/--no-ionice', default=True, help='Run the workers at the lowest best-effort I/O priority.')
+@click.option('--pause', type=float, default=0, help='Seconds to wait after every batch.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default='rerender.checkpoint', help='File recording the last finished request id and the failed ones.')
+@click.option('--resume', is_flag=True, help='Continue after the checkpoint and retry the requests that failed.')
+@with_appcontext
+def rerender_command(request_types, statuses, since, until, workers, batch_size, rate, nice, ionice, pause, checkpoint, resume):
+    global _rerender_app
+    from app.models import Request, RequestType, db
+
+    query = db.session.query(Request.id).filter(Request.render_status != 'deferred')
+    if request_types:
+        query = query.filter(Request.request_type.in_([RequestType(t) for t in request_types]))
+    if statuses:
+        query = query.filter(Request.status.in_(statuses))
+    if since:
+        query = query.filter(Request.time >= since)
+    if until:
+        query = query.filter(Request.time < until)
+
+    last_id, retry = 0, set()
+    if resume and os.path.exists(checkpoint):
+        last_id, retry = _read_checkpoint(checkpoint)
+        query = query.filter(db.or_(Request.id > last_id, Request.id.in_(retry)))
+        click.echo(f'Resuming after request {last_id}, retrying {len(retry)} failed request(s)')
+
+    request_ids = [row.id for row in query.order_by(Request.id)]
+    db.session.remove()
+
+    total = len(request_ids)
+    done = failed = 0
+    started = time.monotonic()
+    click.echo(f'Re-rendering {total} request(s) with {workers} worker(s)')
+
+    _rerender_app = current_app._get_current_object()
+    context = multiprocessing.get_context('fork')
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_rerender_worker, initargs=(nice, ionice)) as pool:
+        for start in range(0, total, batch_size):
+            batch = request_ids[start:start + batch_size]
+            batch_started = time.monotonic()
+
+            # Render the batch, then store every new link in one commit
+            results = {}
+            for request_id, pdf_link, form_data, error in pool.map(_rerender_request, batch):
+                if error:
+                    failed += 1
+                    retry.add(request_id)
+                    click.echo(f'Request {request_id} failed: {error}', err=True)
+                else:
+                    retry.discard(request_id)
+                    results[request_id] = (pdf_link, form_data)
+
+            # Skip requests edited while the batch rendered, their own compile job wins
+            for req in Request.query.filter(Request.id.in_(results)):
+                pdf_link, form_data = results[req.id]
+                if req.form_data == form_data:
+                    req.pdf_link = pdf_link
+                    req.render_status = 'ready'
+            db.session.commit()
+
+            # Failed requests stay on the retry list, --resume picks them up again
+            last_id = max(last_id, batch[-1])
+            _write_checkpoint(checkpoint, last_id, retry)
+
+            done += len(batch)
+            elapsed = time.monotonic() - started
+            click.echo(f'{done}/{total} done, {failed} failed, {done / elapsed:.1f} requests/s')
+
+            # Throttle so a re-render does not starve the live compile workers
+            delay = pause
+            if rate:
+                delay += len(batch) / rate - (time.monotonic() - batch_started)
+            if delay > 0:
+                time.sleep(delay)
+
+    click.echo(f'Finished at {datetime.now():%Y-%m-%d %H:%M:%S}, {failed} failure(s), {len(retry)} left to retry with --resume')
+
+# Migrate the schema and seed the default data, run once per deploy
+@click.command('bootstrap')
+@click.option('--lock-timeout', type=int, default=60, help='Seconds to wait for another bootstrap to finish.')
+@with_appcontext
+def bootstrap_command(lock_timeout):
+    from app.utils.db_utils import advisory_lock, bootstrap_database, SEED_VERSION
+
+    start = time.perf_counter()
+    with advisory_lock('emanage_bootstrap', lock_timeout):
+        bootstrap_database()
+
+    click.echo(f'Database bootstrapped to seed version {SEED_VERSION} in {time.perf_counter() - start:.2f} s')
+
+# Move files from the flat upload folders into the hash-prefix layout, safe to run while the app serves
+@click.command('storage-fanout')
+@click.option('--store', 'stores', multiple=True, type=click.Choice(['forms', 'signatures']), help='Store to migrate, may be repeated, defaults to both.')
+@click.option('--batch-size', type=int, default=1000, help='Files moved between pauses.')
+@click.option('--pause', type=float, default=0.5, help='Seconds to wait between batches.')
+@click.option('--dry-run', is_flag=True, help='Only count the files that would move.')
+@with_appcontext
+def storage_fanout_command(stores, batch_size, pause, dry_run):
+    from app.utils.storage import get_storage, LocalStorage
+
+    for name in stores or ('forms', 'signatures'):
+        storage = get_storage(name)
+        if not isinstance(storage, LocalStorage):
+            raise click.ClickException(f'{name} is not on local storage, nothing to migrate')
+
+        # The directory is streamed, never listed in full, and readers find each file before and after its move
+        moved = 0
+        for key in storage.flat_keys():
+            if dry_run or storage.move_to_fanout(key):
+                moved += 1
+
+            if moved and moved % batch_size == 0:
+                click.echo(f'{name}: {moved} file(s) {"to move" if dry_run else "moved"}')
+                if not dry_run and pause:
+                    time.sleep(pause)
+
+        click.echo(f'{name}: {moved} file(s) {"to move" if dry_run else "moved"} in total')
+
+# Delete expired server-side sessions, Redis expires its own
+@click.command('purge-sessions')
+@with_appcontext
+def purge_sessions_command():
+    interface = current_app.session_interface
+    if not hasattr(interface, 'store'):
+        raise click.ClickException('Sessions are not stored on the server')
+
+    click.echo(f'{interface.store.purge()} expired session(s) deleted')
+
+# Bytes every request sends in its Cookie header: full ID-token claims in a signed cookie against a session id
+@click.command('bench-sessions')
+@with_appcontext
+def bench_sessions_command():
+    import secrets
+    from flask.sessions import SecureCookieSessionInterface
+    from app.auth.routes import session_user
+    from app.auth.role_required import _permission_serializer
+
+    # Claims as Entra ID returns them for a work account
+    now = int(time.time())
+    claims = {
+        'aud': '6731de76-14a6-49ae-97bc-6eba6914391e', 'iss': 'https://login.microsoftonline.com/72f988bf-86f1-41af-91ab-2d7cd011db47/v2.0',
+        'iat': now, 'nbf': now, 'exp': now + 3600,
+        'aio': 'AWQAm/8TAAAAb7dqRZC4hWmGwJVcPs1hc3tQWlSk9S5Xzf2D+XxQmbT0wcvA0Tw7r+GZfpRrfHDLf3+8PGE7BONh3mGdqSdFHkVn1SmyLq4WtLaoDk',
+        'name': 'Jordan Avery Example', 'oid': '00000000-0000-0000-66f3-3332eca7ea81',
+        'preferred_username': 'jordan.example@university.edu', 'rh': '0.AQEAdt4xZ6YUrkmXvG66aRQ5Hu8AAAAAAAAAwAAAAAAAAAABAA.',
+        'sid': '0d1a6e7b-3b8a-4f3c-9d7f-5a2d1e4f8c6b', 'sub': 'AAAAAAAAAAAAAAAAAAAAAIkzqFVrSaSaFHy782bbtaQ', 'tid': '72f988bf-86f1-41af-91ab-2d7cd011db47',
+        'uti': 'fqiBqXLPj0eQa82S-IYFAA', 'ver': '2.0'
+    }
+    permissions = _permission_serializer().dumps({'id': 1, 'roles': ['manager', 'user'], 'unit': 3, 'v': 0})
+
+    name = current_app.config['SESSION_COOKIE_NAME']
+    serializer = SecureCookieSessionInterface().get_signing_serializer(current_app)
+    sizes = {
+        'cookie, full claims': len(f"{name}={serializer.dumps({'user': claims, 'logged_in': True, 'permissions': permissions})}"),
+        'cookie, used claims': len(f"{name}={serializer.dumps({'user': session_user(claims), 'logged_in': True, 'permissions': permissions})}"),
+        'server-side session id': len(f"{name}={secrets.token_urlsafe(32)}")
+    }
+
+    baseline = sizes['cookie, full claims']
+    for label, size in sizes.items():
+        click.echo(f'{label}: {size} bytes per request, {baseline - size} saved')
+
+def register_commands(app):
+    app.cli.add_command(bootstrap_command)
+    app.cli.add_command(compile_worker_command)
+    app.cli.add_command(build_formats_command)
+    app.cli.add_command(bench_compile_command)
+    app.cli.add_command(check_overlay_command)
+    app.cli.add_command(rerender_command)
+    app.cli.add_command(bench_indexes_command)
+    app.cli.add_command(storage_fanout_command)
+    app.cli.add_command(purge_sessions_command)
+    app.cli.add_command(bench_sessions_command)
@@ -7,15 +7,120 @@ class Config:
     CLIENT_SECRET = os.getenv("CLIENT_SECRET")
     REDIRECT_URI = os.getenv("REDIRECT_URI")
     SCOPE = ["User.Read"]
-    SESSION_TYPE = "filesystem"
+
+    # Session storage: 'sql' (sessions table), 'redis' (SESSION_REDIS_URL), 'memory' (one process, for tests)
+    # or 'cookie' for Flask's signed cookie; server-side records expire SESSION_LIFETIME seconds after the last change
+    SESSION_TYPE = os.getenv('SESSION_TYPE', 'sql').lower()
+    SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    PERMANENT_SESSION_LIFETIME = int(os.getenv('SESSION_LIFETIME', 12 * 3600))
+
+    # The MSAL client is cached per process; Azure instance discovery only applies to Azure AD authorities
+    MSAL_INSTANCE_DISCOVERY = os.getenv('MSAL_INSTANCE_DISCOVERY', 'true').lower() == 'true'
     SECRET_KEY = os.getenv("SECRET_KEY")
 
+    # Seconds a cached permission snapshot is trusted before its version is checked
+    PERMISSION_SNAPSHOT_TTL = int(os.getenv('PERMISSION_SNAPSHOT_TTL', 60))
+
     # PDF/Form settings
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads', 'signatures')
     FORM_FOLDER = os.path.join(BASE_DIR, 'uploads', 'forms')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
+    # Uploads: byte budget per file and spool chunk size, and the limit on the whole request body;
+    # room for an unedited phone photo of a signature, which is often 4 to 10 MB
+    UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 12 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 13 * 1024 * 1024))
+
+    # Where compiled forms and signatures are kept: 'local' (FORM_FOLDER and UPLOAD_FOLDER) or 's3',
+    # any S3-compatible service such as MinIO, so every node sees the same files
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+    STORAGE_CHUNK_SIZE = int(os.getenv('STORAGE_CHUNK_SIZE', 64 * 1024))
+
+    # Local storage writes new files under two hash-prefix directories, files in the old flat layout
+    # are still found and are moved over with flask storage-fanout
+    STORAGE_FANOUT = os.getenv('STORAGE_FANOUT', 'true').lower() == 'true'
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+    S3_REGION = os.getenv('S3_REGION')
+    S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY')
+    S3_FORM_PREFIX = os.getenv('S3_FORM_PREFIX', 'forms/')
+    S3_SIGNATURE_PREFIX = os.getenv('S3_SIGNATURE_PREFIX', 'signatures/')
+
+    # Seconds a process trusts its cached organizational unit tree before checking the stored tree version,
+    # changes made in the same process apply at once
+    ORG_TREE_TTL = int(os.getenv('ORG_TREE_TTL', 10))
+
+    # PDF downloads: seconds browsers may reuse a copy without revalidating, and an optional
+    # hand-off to the front-end server, 'x-accel' (nginx, internal location under DOWNLOAD_ACCEL_PREFIX) or 'x-sendfile'
+    DOWNLOAD_MAX_AGE = int(os.getenv('DOWNLOAD_MAX_AGE', 0))
+    DOWNLOAD_OFFLOAD = os.getenv('DOWNLOAD_OFFLOAD', '').lower()
+    DOWNLOAD_ACCEL_PREFIX = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected/forms')
+
+    # Rows per page in the reports lists
+    REPORTS_PAGE_SIZE = int(os.getenv('REPORTS_PAGE_SIZE', 25))
+
+    # Rows per page in the request and user listings, ?per_page= may ask for up to MAX_PAGE_SIZE
+    PAGE_SIZE = int(os.getenv('PAGE_SIZE', 25))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+    # Signature normalization with ImageMagick
+    IMAGEMAGICK_CONVERT = os.getenv('IMAGEMAGICK_CONVERT', 'convert')
+    IMAGEMAGICK_IDENTIFY = os.getenv('IMAGEMAGICK_IDENTIFY', 'identify')
+    IMAGEMAGICK_TIMEOUT = float(os.getenv('IMAGEMAGICK_TIMEOUT', 30))
+    SIGNATURE_MAX_SIZE = os.getenv('SIGNATURE_MAX_SIZE', '600x200')
+    SIGNATURE_MAX_PIXELS = int(os.getenv('SIGNATURE_MAX_PIXELS', 40_000_000))
+    SIGNATURE_BILEVEL = os.getenv('SIGNATURE_BILEVEL', 'false').lower() == 'true'
+
+    # Background compile worker settings
+    COMPILE_WORKERS = int(os.getenv('COMPILE_WORKERS', os.cpu_count() or 1))
+    COMPILE_POLL_INTERVAL = float(os.getenv('COMPILE_POLL_INTERVAL', 1.0))
+    COMPILE_JOB_TIMEOUT = int(os.getenv('COMPILE_JOB_TIMEOUT', 300))
+    COMPILE_MAX_ATTEMPTS = int(os.getenv('COMPILE_MAX_ATTEMPTS', 3))
+    COMPILE_STALE_SWEEP_INTERVAL = float(os.getenv('COMPILE_STALE_SWEEP_INTERVAL', 30))
+
+    # Per-process limit on concurrent pdflatex runs and the wait queue in front of it
+    COMPILE_MAX_CONCURRENCY = int(os.getenv('COMPILE_MAX_CONCURRENCY', os.cpu_count() or 1))
+    COMPILE_MAX_WAITING = int(os.getenv('COMPILE_MAX_WAITING', 2 * (os.cpu_count() or 1)))
+    COMPILE_WAIT_TIMEOUT = float(os.getenv('COMPILE_WAIT_TIMEOUT', 10))
+
+    # Scratch root for compile workspaces, tmpfs by default so compiles stay off the shared volume
+    COMPILE_SCRATCH_ROOT = os.getenv('COMPILE_SCRATCH_ROOT', '/dev/shm')
+
+    # Precompiled LaTeX formats for the form template preambles
+    LATEX_USE_FORMATS = os.getenv('LATEX_USE_FORMATS', 'true').lower() == 'true'
+    LATEX_FORMAT_FOLDER = os.getenv('LATEX_FORMAT_FOLDER', os.path.join(BASE_DIR, 'uploads', 'formats'))
+
+    # Render engine per form template, 'tex' or 'overlay', e.g. FORM_RENDER_ENGINES=student_drop:overlay
+    FORM_RENDER_ENGINES = dict(item.split(':', 1) for item in os.getenv('FORM_RENDER_ENGINES', '').split(',') if ':' in item)
+    OVERLAY_FOLDER = os.getenv('OVERLAY_FOLDER', os.path.join(BASE_DIR, 'uploads', 'overlays'))
+    OVERLAY_FONT_SIZE = float(os.getenv('OVERLAY_FONT_SIZE', 12))
+    SIGNATURE_ASPECT = float(os.getenv('SIGNATURE_ASPECT', 3))
+
     # Database configuration
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool of the primary, pre-ping and recycle keep MySQL from handing out closed connections
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800))
+    }
+
+    # Optional read replica for the dashboards and reports, with its own pool
+    SQLALCHEMY_BINDS = {
+        'replica': {
+            'url': os.getenv('REPLICA_DATABASE_URI'),
+            'pool_size': int(os.getenv('REPLICA_POOL_SIZE', 10)),
+            'max_overflow': int(os.getenv('REPLICA_MAX_OVERFLOW', 10)),
+            'pool_pre_ping': os.getenv('REPLICA_POOL_PRE_PING', 'true').lower() == 'true',
+            'pool_recycle': int(os.getenv('REPLICA_POOL_RECYCLE', 1800))
+        }
+    } if os.getenv('REPLICA_DATABASE_URI') else {}
+
+    # Seconds a user reads from the primary after committing, covers the replication lag
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
@@ -1,14 +1,15 @@
 from . import employee_bp
-from app.auth.role_required import role_required
-from app.models import User, Request
-from flask import render_template, session
+from app.auth.role_required import role_required, get_permissions
+from app.models import Request, REQUEST_SUMMARY
+from app.utils.pagination import keyset_paginate
+from flask import render_template
 
 @employee_bp.route('/requests/delegated')
 @role_required('employee')  # or whatever role check applies
 def delegated_requests():
-    employee = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in employee.roles]
+    permissions = get_permissions()
 
-    requests = Request.query.filter_by(delegated_to_id=employee.id).filter(Request.status != 'draft').all()
+    requests = keyset_paginate(Request.query.options(*REQUEST_SUMMARY).filter_by(delegated_to_id=permissions['id']).filter(Request.status != 'draft'),
+        (Request.time, Request.id), lambda req: (req.time, req.id))
 
-    return render_template('employee_requests.html', requests=requests, roles=roles, logged_in=True)
\ No newline at end of file
+    return render_template('employee_requests.html', requests=requests, roles=permissions['roles'], logged_in=True)
\ No newline at end of file
@@ -1,15 +1,20 @@
-import os
-from flask import render_template, session, redirect, url_for, flash, send_from_directory, current_app
+import os, re
+from flask import render_template, session, redirect, url_for, flash, send_file, current_app, abort, request, Response
 from . import main_bp
-from app.models import User
+from app.models import Request, REQUEST_SUMMARY, db
+from app.auth.role_required import role_required, get_permissions, current_roles, can_view_request
+from app.utils.compile_queue import render_now
+from app.utils.storage import get_storage
+
+# Compiled forms are named <form>_<sha256 of the render inputs>.pdf, a new name whenever the content changes
+CONTENT_HASH = re.compile(r'_([0-9a-f]{64})\.pdf$')
 
 # Home page
 @main_bp.route('/')
 @main_bp.route('/home')
 def home():
     if session.get('logged_in', False):
-        user = User.query.filter_by(azure_id=session['user']['sub']).first()
-        roles = [role.name for role in user.roles]
+        roles = current_roles()
         return render_template('index.html', logged_in=True, roles=roles, user=session['user'])
 
     return render_template('index.html', logged_in=False)
@@ -18,9 +23,8 @@ def home():
 @main_bp.route('/about')
 def about():
     if session.get('logged_in', False):
-        # Get current user and roles
-        user = User.query.filter_by(azure_id=session['user']['sub']).first()
-        roles = [role.name for role in user.roles]
+        # Get current user roles
+        roles = current_roles()
 
         return render_template('about.html', logged_in=True, roles=roles)
 
@@ -31,8 +35,7 @@ def about():
 def page_not_found(error):
     
     if session.get('logged_in', False):
-        user = User.query.filter_by(azure_id=session['user']['sub']).first()
-        roles = [role.name for role in user.roles]
+        roles = current_roles()
 
         return render_template('404.html', logged_in=True, roles=roles)
 
@@ -40,16 +43,82 @@ def page_not_found(error):
 
 # Download PDF form from requests
 @main_bp.route('/download/<filename>', methods=['GET'])
+@role_required('user', 'manager', 'employee', 'admin')
 def download_file(filename):
-    # Ensure the file exists within the uploads directory
-    file_path = os.path.join(current_app.config['FORM_FOLDER'], filename)
-    print("Form Folder: " + current_app.config['FORM_FOLDER'])
-    print("Filename: " + filename)
-    print("Final File Path: " + file_path)
-    
-    if not os.path.exists(file_path):
+    # Only serve PDFs of requests the user may see, several requests can share one PDF
+    permissions = get_permissions()
+    requests = Request.query.options(*REQUEST_SUMMARY).filter_by(pdf_link=filename).all()
+    if not any(can_view_request(permissions, req) for req in requests):
+        abort(404)
+
+    # Ensure the file exists in storage
+    storage = get_storage('forms')
+    try:
+        stored = storage.stat(filename)
+    except ValueError:
+        stored = None
+    if stored is None:
         flash('File not found.', 'danger')
         return redirect(url_for('user.user_requests'))
 
-    # Serve the file for download
-    return send_from_directory(directory=current_app.config['FORM_FOLDER'], path=filename, as_attachment=True)
\ No newline at end of file
+    # Strong validator: the content hash in the file name, or the modification time and size
+    match = CONTENT_HASH.search(filename)
+    etag = match.group(1) if match else f"{int(stored.mtime * 1e9):x}-{stored.size:x}"
+
+    file_path = storage.local_path(filename)
+    offload = current_app.config['DOWNLOAD_OFFLOAD']
+    if file_path and not offload:
+        # Werkzeug answers If-None-Match with 304 and Range with 206
+        response = send_file(file_path, mimetype='application/pdf', as_attachment=True, download_name=filename,
+            etag=etag, conditional=True, max_age=current_app.config['DOWNLOAD_MAX_AGE'])
+    else:
+        response = Response(mimetype='application/pdf')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.set_etag(etag)
+        response.last_modified = stored.mtime
+        response.cache_control.max_age = current_app.config['DOWNLOAD_MAX_AGE']
+
+        if file_path:
+            # Hand the transfer to the front-end server, which also serves ranges
+            if offload == 'x-accel':
+                relative = os.path.relpath(file_path, current_app.config['FORM_FOLDER']).replace(os.sep, '/')
+                response.headers['X-Accel-Redirect'] = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + relative
+            else:
+                response.headers['X-Sendfile'] = file_path
+            response = response.make_conditional(request)
+        else:
+            # Stream from remote storage chunk by chunk, opened only when a body is sent, ranges skip ahead in the stream
+            def chunks():
+                yield from storage.open(filename)
+
+            response.response = chunks()
+            response.direct_passthrough = True
+            response.content_length = stored.size
+            response = response.make_conditional(request, accept_ranges=True, complete_length=stored.size)
+
+    # PDFs belong to one user, keep them out of shared caches
+    response.cache_control.private = True
+    return response
+
+# Download the PDF of a request, rendering deferred drafts on first access
+@main_bp.route('/download/request/<int:request_id>', methods=['GET'])
+@role_required('user', 'manager', 'employee', 'admin')
+def download_request(request_id):
+    req = Request.query.get_or_404(request_id)
+
+    if not can_view_request(get_permissions(), req):
+        abort(404)
+
+    if not req.pdf_link and req.render_status == 'deferred':
+        pdf_link = render_now(req)
+        db.session.commit()
+
+        if not pdf_link:
+            flash('The PDF for this draft could not be generated.', 'danger')
+            return redirect(url_for('user.user_requests'))
+
+    if not req.pdf_link:
+        flash('The PDF for this request is still being generated. Please try again shortly.', 'info')
+        return redirect(url_for('user.user_requests'))
+
+    return redirect(url_for('main.download_file', filename=req.pdf_link))
@@ -1,64 +1,94 @@
-from flask import session, redirect, url_for, render_template, flash
+import math
+from datetime import datetime, timedelta
+from flask import render_template, request, current_app
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from app.manager import manager_bp
-from app.models import Request, User, db
-from app.auth.role_required import role_required
+from app.models import Request, REQUEST_SUMMARY, User, db
+from app.auth.role_required import role_required, get_permissions
+from app.utils.pagination import keyset_paginate
+from app.utils.db_routing import read_replica
 
 # Manage requests dashboard
 @manager_bp.route('/requests/manage')
+@read_replica
 @role_required('manager')
 def manage_requests():
-    manager = User.query.filter_by(azure_id=session['user']['sub']).first()
+    permissions = get_permissions()
 
     # Get requests assigned but not delegated
-    requests = Request.query.filter(
-        Request.current_approver_id == manager.id,
+    requests = keyset_paginate(Request.query.options(*REQUEST_SUMMARY).filter(
+        Request.current_approver_id == permissions['id'],
         Request.delegated_to_id == None,
         Request.status != 'draft'
-    ).all()
+    ), (Request.time, Request.id), lambda req: (req.time, req.id))
 
-    # Get delegated requests
-    delegated_requests = Request.query.join(
+    # Get delegated requests, paged separately
+    delegated_requests = keyset_paginate(Request.query.options(*REQUEST_SUMMARY).join(
         User, Request.delegated_to_id == User.id
     ).filter(
-        User.unit_id == manager.unit_id,
+        User.unit_id == permissions['unit'],
         Request.status != 'draft'
-    ).all()
-
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    ), (Request.time, Request.id), lambda req: (req.time, req.id), prefix='delegated_')
 
     return render_template('manage_requests.html', 
         requests=requests,
         delegated_requests=delegated_requests,
         logged_in=True, 
-        roles=roles)
+        roles=permissions['roles'])
 
 @manager_bp.route('/requests/reports', methods=['GET'])
+@read_replica
 @role_required('manager')
 def reports():
-    manager = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in manager.roles]
+    permissions = get_permissions()
+    roles = permissions['roles']
 
-    # Get all requests for the manager's organizational unit
-    unit_requests = Request.query.filter_by(current_unit_id=manager.unit_id).all()
+    # Optional submission date range, end date inclusive
+    filters = [Request.current_unit_id == permissions['unit']]
+    start = _parse_date(request.args.get('start'))
+    end = _parse_date(request.args.get('end'))
+    if start:
+        filters.append(Request.time >= start)
+    if end:
+        filters.append(Request.time < end + timedelta(days=1))
 
-    # Get pending approvals for the manager's unit
-    pending_requests = Request.query.filter_by(current_unit_id=manager.unit_id, status='pending').all()
+    # Count every status of the unit in one grouped query
+    counts = dict(db.session.query(Request.status, func.count(Request.id)).filter(*filters).group_by(Request.status).all())
+    per_page = current_app.config['REPORTS_PAGE_SIZE']
 
-    # Get historical approvals for the manager's unit
-    approved_requests = Request.query.filter_by(current_unit_id=manager.unit_id, status='approved').all()
+    # One page of each status list, with submitter and approver loaded in the same query
+    lists, pages = {}, {}
+    for status in ('pending', 'approved', 'rejected'):
+        page_count = max(1, math.ceil(counts.get(status, 0) / per_page))
+        page = min(max(request.args.get(f'{status}_page', 1, type=int), 1), page_count)
 
-    # Get rejected requests for the manager's unit
-    rejected_requests = Request.query.filter_by(current_unit_id=manager.unit_id, status='rejected').all()
+        lists[status] = Request.query.options(
+            *REQUEST_SUMMARY,
+            joinedload(Request.user),
+            joinedload(Request.current_approver)
+        ).filter(*filters, Request.status == status).order_by(
+            Request.time.desc(), Request.id.desc()
+        ).offset((page - 1) * per_page).limit(per_page).all()
 
-    print(manager.unit_id)
+        pages[status] = {'page': page, 'pages': page_count}
 
     return render_template(
         'reports.html',
-        unit_requests=unit_requests,
-        pending_requests=pending_requests,
-        approved_requests=approved_requests,
-        rejected_requests=rejected_requests,
+        total_requests=sum(counts.values()),
+        counts=counts,
+        pages=pages,
+        pending_requests=lists['pending'],
+        approved_requests=lists['approved'],
+        rejected_requests=lists['rejected'],
+        start=start,
+        end=end,
         logged_in=True,
-        roles=roles)
\ No newline at end of file
+        roles=roles)
+
+# Date from a YYYY-MM-DD query argument, None if missing or invalid
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
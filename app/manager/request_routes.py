@@ -1,22 +1,22 @@
-from flask import session, redirect, url_for, flash, request, render_template
+from flask import redirect, url_for, flash, render_template
 from app.manager import manager_bp
-from app.models import Request, User, db
-from app.auth.role_required import role_required
+from app.models import Request, REQUEST_SUMMARY, User, db
+from app.auth.role_required import role_required, get_permissions
 from app.forms import DelegateRequestForm
+from app.utils.org_tree import get_org_tree
 
 # Approve request
 @manager_bp.route('/requests/approve/<int:id>', methods=['POST'])
 @role_required('manager', 'employee')
 def approve_request(id):
-    req = Request.query.get_or_404(id)
-    manager = User.query.filter_by(azure_id=session['user']['sub']).first()
-
-    if req.current_approver_id != manager.id:
+    req = Request.query.options(*REQUEST_SUMMARY).get_or_404(id)
+    if req.current_approver_id != get_permissions()['id']:
         flash('You are not authorized to approve this request.', 'danger')
         return redirect(url_for('manager.manage_requests'))
     
-    if req.current_unit and req.current_unit.parent:
-        parent_unit = req.current_unit.parent
+    # Forward to the parent unit from the cached tree
+    parent_unit = get_org_tree().parent(req.current_unit_id)
+    if parent_unit:
         req.current_unit_id = parent_unit.id
         req.current_approver_id = parent_unit.manager_id
         req.delegated_to_id = None
@@ -34,7 +34,7 @@ def approve_request(id):
 @manager_bp.route('/requests/return/<int:id>', methods=['POST'])
 @role_required('manager', 'employee')
 def return_request(id):
-    req = Request.query.get_or_404(id)
+    req = Request.query.options(*REQUEST_SUMMARY).get_or_404(id)
     req.status = 'returned'
     req.modified_at = db.func.now()
     
@@ -47,7 +47,7 @@ def return_request(id):
 @manager_bp.route('/requests/reject/<int:id>', methods=['POST'])
 @role_required('manager', 'employee')
 def reject_request(id):
-    req = Request.query.get_or_404(id)
+    req = Request.query.options(*REQUEST_SUMMARY).get_or_404(id)
     req.status = 'rejected'
     req.modified_at = db.func.now()
     
@@ -60,16 +60,16 @@ def reject_request(id):
 @manager_bp.route('/requests/delegate/<int:id>', methods=['POST', 'GET'])
 @role_required('manager')
 def delegate_request(id):
-    req = Request.query.get_or_404(id)
-    manager = User.query.filter_by(azure_id=session['user']['sub']).first()
+    req = Request.query.options(*REQUEST_SUMMARY).get_or_404(id)
+    permissions = get_permissions()
 
     # Ensure request belongs to the manager's unit
-    if req.current_approver_id != manager.id:
+    if req.current_approver_id != permissions['id']:
         flash('You are not authorized to delegate this request.', 'danger')
         return redirect(url_for('manager.manage_requests'))
     
     # Get employees in the manager's OU
-    employees = User.query.filter_by(unit_id=manager.unit_id, active=True).all()
+    employees = User.query.filter_by(unit_id=permissions['unit'], active=True).all()
 
     # Populate form with employees
     form = DelegateRequestForm()
@@ -84,9 +84,5 @@ def delegate_request(id):
         flash('Request delegated successfully.', 'success')
         return redirect(url_for('manager.manage_requests'))
     
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
-    
-    return render_template('delegate_request.html', form=form, request=req, logged_in=True, roles=roles)
+    return render_template('delegate_request.html', form=form, request=req, logged_in=True, roles=permissions['roles'])
     
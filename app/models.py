@@ -1,7 +1,8 @@
 import enum
 from flask_sqlalchemy import SQLAlchemy
+from app.utils.db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class OrganizationalUnit(db.Model):
     __tablename__ = 'organizational_units'
@@ -18,6 +19,21 @@ class OrganizationalUnit(db.Model):
     def __repr__(self):
         return f"<OrgUnit {self.name}"
 
+# Markers written by flask bootstrap, such as the seed version
+class AppState(db.Model):
+    __tablename__ = 'app_state'
+
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(100), nullable=False)
+
+# Server-side session data, the session cookie only holds the id
+class UserSession(db.Model):
+    __tablename__ = 'sessions'
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
 # Association table for users and roles
 user_roles = db.Table('user_roles',
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
@@ -38,6 +54,11 @@ class Role(db.Model):
 class User(db.Model):
     __tablename__ = 'users'
 
+    # Employees of a unit, used when delegating and for the delegated requests list
+    __table_args__ = (
+        db.Index('ix_users_unit_active', 'unit_id', 'active'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     azure_id = db.Column(db.String(100), unique=True)
     name = db.Column(db.String(100))
@@ -45,6 +66,9 @@ class User(db.Model):
     roles = db.relationship('Role', secondary=user_roles, backref=db.backref('users', lazy='dynamic'))
     active = db.Column(db.Boolean(), default=True)
 
+    # Bumped whenever roles, unit or active change, invalidates cached permissions
+    perm_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Organizational unit info
     unit_id = db.Column(db.Integer, db.ForeignKey('organizational_units.id'))
     unit = db.relationship('OrganizationalUnit', foreign_keys=[unit_id], backref='users')
@@ -55,6 +79,9 @@ class User(db.Model):
     def has_role(self, role_name):
         return any(role.name == role_name for role in self.roles)
 
+    def bump_perm_version(self):
+        self.perm_version = User.perm_version + 1
+
     def __repr__(self):
         return f"<User {self.name}>"
 
@@ -68,6 +95,16 @@ class RequestType(enum.Enum):
 class Request(db.Model):
     __tablename__ = 'requests'
 
+    # Indexes for the dashboard queries: approver queue, delegated lists, own requests and unit reports,
+    # and for finding the requests of a PDF on download
+    __table_args__ = (
+        db.Index('ix_requests_approver_delegated_status', 'current_approver_id', 'delegated_to_id', 'status'),
+        db.Index('ix_requests_delegated_status', 'delegated_to_id', 'status'),
+        db.Index('ix_requests_user_time', 'user_id', 'time', 'id'),
+        db.Index('ix_requests_unit_status_time', 'current_unit_id', 'status', 'time'),
+        db.Index('ix_requests_pdf_link', 'pdf_link'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     # Meta data
@@ -87,9 +124,12 @@ class Request(db.Model):
     delegated_to_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     delegated_to = db.relationship('User', foreign_keys=[delegated_to_id])
 
-    # Filenames
-    pdf_link = db.Column(db.String(100), nullable=False)
+    # Filenames, pdf_link is filled in by the compile worker
+    pdf_link = db.Column(db.String(100), nullable=True)
     sig_link = db.Column(db.String(100))
+
+    # Render status of the PDF: queued, compiling, ready, failed or deferred (drafts)
+    render_status = db.Column(db.String(10), nullable=False, default='ready', server_default='ready')
     
     # Form fields
     form_data = db.Column(db.JSON)
@@ -97,4 +137,41 @@ class Request(db.Model):
     modified_at = db.Column(db.DateTime, nullable=True)
 
     # Relationship to user
-    user = db.relationship('User', foreign_keys=[user_id], back_populates='requests')
\ No newline at end of file
+    user = db.relationship('User', foreign_keys=[user_id], back_populates='requests')
+
+# Loader options for listings and status changes, only the edit views and the PDF compile read the form fields
+REQUEST_SUMMARY = (
+    db.defer(Request.form_data, raiseload=True),
+    db.defer(Request.sig_link, raiseload=True)
+)
+
+# Background PDF compile job
+class CompileJob(db.Model):
+    __tablename__ = 'compile_jobs'
+
+    # Workers claim by status and priority, enqueue clears queued jobs of a request
+    __table_args__ = (
+        db.Index('ix_compile_jobs_status_priority', 'status', 'priority', 'id'),
+        db.Index('ix_compile_jobs_request_status', 'request_id', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('requests.id'), nullable=False)
+
+    # queued, compiling, ready or failed
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+
+    # Worker that claimed the job and when, used to recover from crashed workers
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    finished_at = db.Column(db.DateTime)
+
+    request = db.relationship('Request', backref=db.backref('compile_jobs', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f"<CompileJob {self.id} {self.status}>"
@@ -1,9 +1,37 @@
-from msal import ConfidentialClientApplication
+import threading
+from msal import ConfidentialClientApplication, TokenCache
 from flask import current_app
 
+# One client per process, built on first use: authority and OpenID metadata are discovered once
+_lock = threading.Lock()
+_apps = {}
+
+# HTTP responses MSAL may reuse, such as instance discovery and the OpenID configuration
+_http_cache = {}
+
+# Login only reads the ID token claims and no route calls an API with the user's tokens, so none are kept:
+# a cache shared by the process would grow with every login and hold every user's refresh token
+class DiscardingTokenCache(TokenCache):
+    def add(self, event, **kwargs):
+        pass
+
 def get_msal_app():
-    return ConfidentialClientApplication(
-        current_app.config['CLIENT_ID'],
-        client_credential=current_app.config['CLIENT_SECRET'],
-        authority=current_app.config['AUTHORITY']
-    )
\ No newline at end of file
+    config = current_app.config
+    key = (config['CLIENT_ID'], config['AUTHORITY'])
+
+    app = _apps.get(key)
+    if app is None:
+        with _lock:
+            app = _apps.get(key)
+            if app is None:
+                app = ConfidentialClientApplication(
+                    config['CLIENT_ID'],
+                    client_credential=config['CLIENT_SECRET'],
+                    authority=config['AUTHORITY'],
+                    token_cache=DiscardingTokenCache(),
+                    http_cache=_http_cache,
+                    instance_discovery=config['MSAL_INSTANCE_DISCOVERY']
+                )
+                _apps[key] = app
+
+    return app
@@ -1,8 +1,10 @@
-from flask import redirect, render_template, session, flash, url_for, request
+from flask import redirect, render_template, session, flash, url_for, request, jsonify, abort
 from app.forms import ProfileForm
-from app.models import User, Request, db
+from app.models import Request, REQUEST_SUMMARY, db
 from app.user import user_bp
-from app.auth.role_required import role_required
+from app.auth.role_required import role_required, get_current_user, get_permissions, current_roles, can_view_request
+from app.utils.pagination import keyset_paginate
+from app.utils.db_routing import read_replica
 
 @user_bp.route('/profile', methods=['GET', 'POST'])
 @role_required('user')
@@ -12,7 +14,7 @@ def profile():
         return redirect(url_for("auth.login"))
     
     # Ensure the user exists
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
+    user = get_current_user()
     if not user:
         flash('User not found', 'error')
         return redirect(url_for("main.home"))
@@ -41,26 +43,41 @@ def profile():
 
         return redirect(url_for("user.profile"))
     
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get current user roles
+    roles = current_roles()
 
     return render_template('profile.html', form=form, logged_in=True, roles=roles)
 
 @user_bp.route('/requests/manage')
+@read_replica
 @role_required('user')
 def user_requests():
    
     # Get user id for requests
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
+    permissions = get_permissions()
 
-    # Get all requests
-    requests = Request.query.filter_by(user_id=user.id).all()
-
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get a page of requests, newest first
+    requests = keyset_paginate(Request.query.options(*REQUEST_SUMMARY).filter_by(user_id=permissions['id']),
+        (Request.time, Request.id), lambda req: (req.time, req.id))
 
     return render_template('user_requests.html',
         requests=requests,
-        logged_in=True, roles=roles)
\ No newline at end of file
+        logged_in=True, roles=permissions['roles'])
+
+# Render status of a request's PDF
+@user_bp.route('/requests/<int:request_id>/status')
+@role_required('user', 'manager', 'employee')
+def request_status(request_id):
+    req = Request.query.options(*REQUEST_SUMMARY).get_or_404(request_id)
+
+    # Only the owner and the assigned approvers can see the status
+    if not can_view_request(get_permissions(), req):
+        abort(404)
+
+    pdf_url = None
+    if req.render_status == 'ready' and req.pdf_link:
+        pdf_url = url_for('main.download_file', filename=req.pdf_link)
+    elif req.render_status == 'deferred':
+        pdf_url = url_for('main.download_request', request_id=req.id)
+
+    return jsonify(id=req.id, status=req.status, render_status=req.render_status, pdf_url=pdf_url)
@@ -1,12 +1,12 @@
 from flask import redirect, url_for, abort
-from app.models import Request, RequestType
+from app.models import Request, RequestType, REQUEST_SUMMARY
 from app.user import user_bp
 from app.auth.role_required import role_required
 
 @user_bp.route('/requests/edit/<int:request_id>')
 @role_required('user')
 def edit_request(request_id):
-    request = Request.query.get_or_404(request_id)
+    request = Request.query.options(*REQUEST_SUMMARY).get_or_404(request_id)
 
     match request.request_type:
         case RequestType.FERPA:
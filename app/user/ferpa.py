@@ -1,11 +1,13 @@
-import os, uuid
 from datetime import datetime
-from flask import request, session, render_template, flash, redirect, url_for, current_app
-from app.models import User, Request, RequestType, OrganizationalUnit, db
-from app.auth.role_required import role_required
+from flask import request, session, render_template, flash, redirect, url_for
+from app.models import Request, RequestType, db
+from app.auth.role_required import role_required, get_permissions, current_roles
 from app.forms import FERPAForm
 from app.user import user_bp
-from app.utils.request_utils import allowed_file, return_choice, generate_ferpa
+from app.utils.request_utils import allowed_file, return_choice
+from app.utils.compile_queue import enqueue_compile
+from app.utils.file_utils import save_signature
+from app.utils.org_tree import get_org_tree
 
 # Create a new FERPA request via a form
 @user_bp.route('/requests/ferpa', methods=['GET', 'POST'])
@@ -14,8 +16,8 @@ def ferpa_request():
     # User FERPA form
     form = FERPAForm()
 
-    # Get current user
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
+    # Get current user id
+    user_id = get_permissions()['id']
 
     if form.validate_on_submit():
         
@@ -32,14 +34,11 @@ def ferpa_request():
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('ferpa.html', form=form, logged_in=True)
 
             # Construct a dictionary for the PDF
             official_choices = form.official_choices.data
@@ -80,27 +79,23 @@ def ferpa_request():
                  "OPT_OTHER_RELEASE": return_choice(release_choices, 'other'),
                  "OTHERRELEASE": form.release_other.data,
 
-                 "PASSWORD": form.password.data, "PEOPLESOFT": form.peoplesoft_id.data, "SIGNATURE": latex_path, "DATE": str(form.date.data)
+                 "PASSWORD": form.password.data, "PEOPLESOFT": form.peoplesoft_id.data, "SIGNATURE": unique_filename, "DATE": str(form.date.data)
             }
 
-            # Generate PDF and store path
-            pdf_file = generate_ferpa(data)
-
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
             # Get organizational unit for form, make sure it and the manager exist
-            ferpa_unit = OrganizationalUnit.query.filter_by(name='Identity and Records').first()
+            ferpa_unit = get_org_tree().by_unit_name('Identity and Records')
             if not ferpa_unit or not ferpa_unit.manager_id:
                 flash('FERPA request cannot be submitted. No manager found for Identity and Records.', 'error')
                 return redirect(url_for('user.user_requests'))
             
             # Create new FERPA request
             new_request = Request(
-                user_id=user.id,
+                user_id=user_id,
                 status=status,
                 request_type=RequestType.FERPA,
-                pdf_link=pdf_file,
                 sig_link=unique_filename,
                 form_data=data,
                 current_approver_id=ferpa_unit.manager_id,
@@ -109,13 +104,13 @@ def ferpa_request():
 
             # Commit FERPA request to database
             db.session.add(new_request)
+            enqueue_compile(new_request)
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
 
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get current user roles
+    roles = current_roles()
 
     return render_template('ferpa.html', form=form, logged_in=True, roles=roles)
 
@@ -221,14 +216,11 @@ def edit_ferpa_request(ferpa_request_id):
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('ferpa.html', form=form, logged_in=True)
 
             # Construct a dictionary for the PDF
             official_choices = form.official_choices.data
@@ -269,28 +261,26 @@ def edit_ferpa_request(ferpa_request_id):
                  "OPT_OTHER_RELEASE": return_choice(release_choices, 'other'),
                  "OTHERRELEASE": form.release_other.data,
 
-                 "PASSWORD": form.password.data, "PEOPLESOFT": form.peoplesoft_id.data, "SIGNATURE": latex_path, "DATE": str(form.date.data)
+                 "PASSWORD": form.password.data, "PEOPLESOFT": form.peoplesoft_id.data, "SIGNATURE": unique_filename, "DATE": str(form.date.data)
             }
 
-            # Generate PDF and store path
-            pdf_link = generate_ferpa(new_data)
-
             # Pending or draft?
             if form.is_draft.data: status = "draft"
             else: status = "pending"
             
             # Update attributes of request
             ferpa_request.status = status
-            ferpa_request.pdf_link = pdf_link
             ferpa_request.form_data = new_data
 
+            # Queue the PDF compile
+            enqueue_compile(ferpa_request)
+
             # Commit FERPA request to database
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
     
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get current user roles
+    roles = current_roles()
 
     return render_template('ferpa.html', form=form, logged_in=True, roles=roles)
\ No newline at end of file
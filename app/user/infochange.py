@@ -1,10 +1,12 @@
-import os, uuid
 from datetime import datetime
-from flask import request, session, render_template, flash, redirect, url_for, current_app
-from app.models import User, Request, RequestType, OrganizationalUnit, db
-from app.auth.role_required import role_required
+from flask import request, session, render_template, flash, redirect, url_for
+from app.models import Request, RequestType, db
+from app.auth.role_required import role_required, get_permissions, current_roles
 from app.forms import InfoChangeForm
-from app.utils.request_utils import allowed_file, return_choice, generate_ssn_name
+from app.utils.request_utils import allowed_file, return_choice
+from app.utils.compile_queue import enqueue_compile
+from app.utils.file_utils import save_signature
+from app.utils.org_tree import get_org_tree
 from app.user import user_bp
 
 @user_bp.route('/requests/info_change', methods=['GET', 'POST'])
@@ -14,8 +16,8 @@ def info_change_request():
     # Name/SSN change form
     form = InfoChangeForm()
 
-    # Get current user from session
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
+    # Get current user id from session
+    user_id = get_permissions()['id']
 
     if not form.validate_on_submit():
         print(form.errors)
@@ -34,18 +36,12 @@ def info_change_request():
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('info_change.html', form=form, logged_in=True)
 
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
-
-            # Get user id from session
-            user_id = user.id
-            
             # Construct dictionary for the PDF
             choice = form.choice.data
             name_change_reason = form.name_change_reason.data
@@ -64,17 +60,14 @@ def info_change_request():
                 "SSN_OLD": form.ssn_old.data, "SSN_NEW": form.ssn_new.data,
                 "OPT_ERROR_SSN": return_choice(ssn_change_reason, 'error'),
                 "OPT_ADD_SSN": return_choice(ssn_change_reason, 'addition'),
-                "SIGNATURE": latex_path,
+                "SIGNATURE": unique_filename,
                 "DATE": str(form.date.data)}
 
-            # Pass dictionary to function
-            pdf_link = generate_ssn_name(data)
-
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
             # Get organizational unit for form, make sure it and the manager exist
-            infochange_unit = OrganizationalUnit.query.filter_by(name='Identity and Records').first()
+            infochange_unit = get_org_tree().by_unit_name('Identity and Records')
             if not infochange_unit or not infochange_unit.manager_id:
                 flash('Information change request cannot be submitted. No manager found for Identity and Records.', 'error')
                 return redirect(url_for('user.user_requests'))
@@ -84,7 +77,6 @@ def info_change_request():
                 user_id=user_id,
                 status=status,
                 request_type=RequestType.INFO,
-                pdf_link=pdf_link,
                 sig_link=unique_filename,
                 form_data=data,
                 current_approver_id=infochange_unit.manager_id,
@@ -93,12 +85,13 @@ def info_change_request():
 
             # Commit infochange request to database
             db.session.add(new_request)
+            enqueue_compile(new_request)
             db.session.commit()
             
             return redirect(url_for('user.user_requests'))
 
     # Get current user and roles
-    roles = [role.name for role in user.roles]
+    roles = current_roles()
 
     return render_template('info_change.html', form=form, logged_in=True, roles=roles)
 
@@ -177,23 +170,20 @@ def edit_infochange_request(infochange_request_id):
         # Ensure the user uploaded a signature
         if 'signature' not in request.files:
             flash('Signature was not uploaded.', 'danger')
-            return render_template('ferpa.html', form=form, logged_in=True)
+            return render_template('info_change.html', form=form, logged_in=True)
         
         file = request.files['signature']
         if file.filename == '':
             flash('No file selected for signature.', 'danger')
-            return render_template('ferpa.html', form=form, logged_in=True)
+            return render_template('info_change.html', form=form, logged_in=True)
         
         # Check the file is allowed
         if file and allowed_file(file.filename):
-        # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('info_change.html', form=form, logged_in=True)
 
             # Construct dictionary for the PDF
             choice = form.choice.data
@@ -213,25 +203,23 @@ def edit_infochange_request(infochange_request_id):
                 "SSN_OLD": form.ssn_old.data, "SSN_NEW": form.ssn_new.data,
                 "OPT_ERROR_SSN": return_choice(ssn_change_reason, 'error'),
                 "OPT_ADD_SSN": return_choice(ssn_change_reason, 'addition'),
-                "SIGNATURE": latex_path,
+                "SIGNATURE": unique_filename,
                 "DATE": str(form.date.data)}
-            
-            # Generate PDF and store path
-            pdf_link = generate_ssn_name(new_data)
 
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
             # Update fields of request
             infochange_request.status = status
-            infochange_request.pdf_link = pdf_link
             infochange_request.form_data = new_data
 
+            # Queue the PDF compile
+            enqueue_compile(infochange_request)
+
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
         
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    roles = current_roles()
 
     return render_template('info_change.html', form=form, logged_in=True, roles=roles)
\ No newline at end of file
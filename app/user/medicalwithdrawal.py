@@ -1,11 +1,13 @@
-import os, uuid
 from datetime import datetime
-from flask import request, session, render_template, flash, redirect, url_for, current_app
-from app.models import User, Request, RequestType, OrganizationalUnit, db
-from app.auth.role_required import role_required
+from flask import request, session, render_template, flash, redirect, url_for
+from app.models import Request, RequestType, db
+from app.auth.role_required import role_required, get_permissions, current_roles
 from app.forms import MedicalWithdrawalForm
 from app.user import user_bp
-from app.utils.request_utils import allowed_file, return_choice_bool, generate_withdrawal
+from app.utils.request_utils import allowed_file, return_choice_bool
+from app.utils.compile_queue import enqueue_compile
+from app.utils.file_utils import save_signature
+from app.utils.org_tree import get_org_tree
 
 @user_bp.route('/requests/medical_withdrawal', methods=['GET', 'POST'])
 @role_required('user')
@@ -14,8 +16,8 @@ def medical_withdrawal_request():
     # Name/SSN change form
     form = MedicalWithdrawalForm()
 
-    # Get current user
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
+    # Get current user id
+    user_id = get_permissions()['id']
 
     if not form.validate_on_submit():
         print(form.errors)
@@ -34,14 +36,11 @@ def medical_withdrawal_request():
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('medical_withdrawal.html', form=form, logged_in=True)
 
             # Create dictionary to pass to function
             data = {
@@ -67,29 +66,26 @@ def medical_withdrawal_request():
                 "SUBJECT": form.subject.data,
                 "NUMBER": form.number.data,
                 "SECTION": form.section.data,
-                "SIGNATURE": latex_path,
+                "SIGNATURE": unique_filename,
                 "INITIAL": form.initial.data,
                 "DATE": str(form.date.data)
             }
 
-            pdf_link = generate_withdrawal(data)
-
             # Pending or draft?
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
             # Ensure organizational unit and manager exist
-            medical_unit = OrganizationalUnit.query.filter_by(name='Health and Wellness').first()
+            medical_unit = get_org_tree().by_unit_name('Health and Wellness')
             if not medical_unit or not medical_unit.manager_id:
                 flash('Health and Wellness unit not found or no manager assigned.', 'error')
                 return redirect(url_for('user.user_requests'))
 
             # Create new request
             new_request = Request(
-                user_id=user.id,
+                user_id=user_id,
                 status=status,
                 request_type=RequestType.MEDICAL,
-                pdf_link=pdf_link,
                 sig_link=unique_filename,
                 form_data=data,
                 current_approver_id=medical_unit.manager_id,
@@ -97,12 +93,13 @@ def medical_withdrawal_request():
             )
 
             db.session.add(new_request)
+            enqueue_compile(new_request)
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
         
     # Get user roles
-    roles = [role.name for role in user.roles]
+    roles = current_roles()
 
     return render_template('medical_withdrawal.html', form=form, logged_in=True, roles=roles)
 
@@ -189,14 +186,11 @@ def edit_withdrawal_request(withdrawal_request_id):
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('medical_withdrawal.html', form=form, logged_in=True)
 
             # Create dictionary to pass to function
             new_data = {
@@ -204,6 +198,7 @@ def edit_withdrawal_request(withdrawal_request_id):
                 "PEOPLESOFT": form.peoplesoft_id.data,
                 "COLLEGE": form.college.data,
                 "DEGREE": form.degree.data,
+                "ADDRESS": form.address.data,
                 "CITY": form.city.data,
                 "STATE": form.state.data,
                 "ZIPCODE": form.zip_code.data,
@@ -222,27 +217,26 @@ def edit_withdrawal_request(withdrawal_request_id):
                 "NUMBER": form.number.data,
                 "SECTION": form.section.data,
                 "INITIAL": form.initial.data,
-                "SIGNATURE": latex_path,
+                "SIGNATURE": unique_filename,
                 "DATE": str(form.date.data)
             }
 
-            pdf_link = generate_withdrawal(new_data)
-
             # Pending or draft?
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
             # Update attribute values of request
             withdrawal_request.status = status
-            withdrawal_request.pdf_link = pdf_link
             withdrawal_request.form_data = new_data
 
+            # Queue the PDF compile
+            enqueue_compile(withdrawal_request)
+
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
 
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get current user roles
+    roles = current_roles()
 
     return render_template('medical_withdrawal.html', form=form, logged_in=True, roles=roles)
\ No newline at end of file
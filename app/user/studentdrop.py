@@ -1,11 +1,13 @@
-import os, uuid
 from datetime import datetime
-from flask import request, session, render_template, flash, redirect, url_for, current_app
-from app.models import User, Request, RequestType, OrganizationalUnit, db
-from app.auth.role_required import role_required
+from flask import request, session, render_template, flash, redirect, url_for
+from app.models import Request, RequestType, db
+from app.auth.role_required import role_required, get_permissions, current_roles
 from app.forms import StudentDropForm
 from app.user import user_bp
-from app.utils.request_utils import allowed_file, return_choice_bool, generate_drop
+from app.utils.request_utils import allowed_file, return_choice_bool
+from app.utils.compile_queue import enqueue_compile
+from app.utils.file_utils import save_signature
+from app.utils.org_tree import get_org_tree
 
 @user_bp.route('/requests/student_drop', methods=['GET', 'POST'])
 @role_required('user')
@@ -14,8 +16,8 @@ def student_drop_request():
     # Name/SSN change form
     form = StudentDropForm()
 
-    # Get current user
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
+    # Get current user id
+    user_id = get_permissions()['id']
 
     if not form.validate_on_submit():
         print(form.errors)
@@ -24,24 +26,21 @@ def student_drop_request():
         # Ensure the user uploaded a signature
         if 'signature' not in request.files:
             flash('Signature was not uploaded.', 'danger')
-            return render_template('medical_withdrawal.html', form=form, logged_in=True)
+            return render_template('student_drop.html', form=form, logged_in=True)
 
         file = request.files['signature']
         if file.filename == '':
             flash('No file selected for signature.', 'danger')
-            return render_template('medical_withdrawal.html', form=form, logged_in=True)
+            return render_template('student_drop.html', form=form, logged_in=True)
 
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('student_drop.html', form=form, logged_in=True)
 
             # Create dictionary to pass to function
             data = {
@@ -52,26 +51,23 @@ def student_drop_request():
                 "SUBJECT": form.subject.data,
                 "NUMBER": form.number.data,
                 "SECTION": form.section.data,
-                "SIGNATURE": latex_path,
+                "SIGNATURE": unique_filename,
                 "DATE": str(form.date.data)
             }
 
-            pdf_link = generate_drop(data)
-
             # Pending or draft?
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
-            drop_unit = OrganizationalUnit.query.filter_by(name='Advising').first()    
+            drop_unit = get_org_tree().by_unit_name('Advising')
             if not drop_unit or not drop_unit.manager_id:
                 flash('Advising unit not found or no manager assigned.', 'error')
                 return redirect(url_for('user.user_requests'))
 
             new_request = Request(
-                user_id=user.id,
+                user_id=user_id,
                 status=status,
                 request_type=RequestType.DROP,
-                pdf_link=pdf_link,
                 sig_link=unique_filename,
                 form_data=data,
                 current_approver_id=drop_unit.manager_id,
@@ -79,12 +75,13 @@ def student_drop_request():
             )
 
             db.session.add(new_request)
+            enqueue_compile(new_request)
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
         
     # Get user roles
-    roles = [role.name for role in user.roles]
+    roles = current_roles()
 
     return render_template('student_drop.html', form=form, logged_in=True, roles=roles)
 
@@ -130,28 +127,21 @@ def edit_drop_request(drop_request_id):
         # Ensure the user uploaded a signature
         if 'signature' not in request.files:
             flash('Signature was not uploaded.', 'danger')
-            return render_template('medical_withdrawal.html', form=form, logged_in=True)
+            return render_template('student_drop.html', form=form, logged_in=True)
 
         file = request.files['signature']
         if file.filename == '':
             flash('No file selected for signature.', 'danger')
-            return render_template('medical_withdrawal.html', form=form, logged_in=True)
+            return render_template('student_drop.html', form=form, logged_in=True)
 
         # Check the file is allowed
         if file and allowed_file(file.filename):
             
-            # Generate a unique name for the image
-            unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-
-            # Save file with new name
-            filepath = os.path.normpath(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-            file.save(filepath)
-
-            latex_path = filepath.replace("\\", "/")
-
-            # Get user id from session
-            user = User.query.filter_by(azure_id=session['user']['sub']).first()
-            user_id = user.id
+            # Normalize the signature image and store it under a unique name
+            unique_filename = save_signature(file)
+            if not unique_filename:
+                flash('The signature must be a PNG or JPEG image.', 'danger')
+                return render_template('student_drop.html', form=form, logged_in=True)
 
             # Create dictionary to pass to function
             new_data = {
@@ -161,27 +151,26 @@ def edit_drop_request(drop_request_id):
                 "SUBJECT": form.subject.data,
                 "NUMBER": form.number.data,
                 "SECTION": form.section.data,
-                "SIGNATURE": latex_path,
+                "SIGNATURE": unique_filename,
                 "DATE": str(form.date.data)
             }
 
-            pdf_link = generate_drop(new_data)
-
             # Pending or draft?
             if form.is_draft.data: status = "draft"
             else: status = "pending"
 
             # Update attribute values of request
             drop_request.status = status
-            drop_request.pdf_link = pdf_link
             drop_request.form_data = new_data
 
+            # Queue the PDF compile
+            enqueue_compile(drop_request)
+
             db.session.commit()
 
             return redirect(url_for('user.user_requests'))
 
-    # Get current user and roles
-    user = User.query.filter_by(azure_id=session['user']['sub']).first()
-    roles = [role.name for role in user.roles]
+    # Get current user roles
+    roles = current_roles()
 
-    return render_template('medical_withdrawal.html', form=form, logged_in=True, roles=roles)
\ No newline at end of file
+    return render_template('student_drop.html', form=form, logged_in=True, roles=roles)
\ No newline at end of file
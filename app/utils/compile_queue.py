@@ -0,0 +1,220 @@
+import os, socket, threading, time, uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from app.models import CompileJob, Request, RequestType, db
+from app.utils.compile_scheduler import CompileRejected, PRIORITY_SUBMIT, PRIORITY_DRAFT
+from app.utils.storage import get_storage
+from app.utils.request_utils import generate_ferpa, generate_ssn_name, generate_withdrawal, generate_drop, cached_pdf, cache_stats, REQUEST_TEMPLATES
+
+# PDF generator for each request type
+GENERATORS = {
+    RequestType.FERPA: generate_ferpa,
+    RequestType.INFO: generate_ssn_name,
+    RequestType.MEDICAL: generate_withdrawal,
+    RequestType.DROP: generate_drop
+}
+
+# Queue a PDF compile for a request, the caller commits
+def enqueue_compile(req):
+    # Drop jobs that have not started yet, the new job renders the latest form data
+    if req.id is not None:
+        CompileJob.query.filter_by(request_id=req.id, status='queued').delete(synchronize_session=False)
+
+    # Identical form data and signature, reuse the existing PDF
+    pdf_link = cached_pdf(REQUEST_TEMPLATES[req.request_type], req.form_data)
+    if pdf_link:
+        req.pdf_link = pdf_link
+        req.render_status = 'ready'
+        return None
+
+    # Drafts are rendered on first download or when they are submitted
+    if req.status == 'draft':
+        req.pdf_link = None
+        req.render_status = 'deferred'
+        return None
+
+    # The old PDF shows the previous form data, it is not offered while the new one renders
+    job = CompileJob(request=req, status='queued', priority=PRIORITY_SUBMIT)
+    req.pdf_link = None
+    req.render_status = 'queued'
+    db.session.add(job)
+
+    return job
+
+# Render a deferred PDF inside the current request, the caller commits
+def render_now(req):
+    req.render_status = 'compiling'
+    pdf_link = GENERATORS[req.request_type](req.form_data, PRIORITY_DRAFT)
+
+    # Leave the draft deferred so the next download tries again
+    if not get_storage('forms').exists(pdf_link):
+        req.render_status = 'deferred'
+        return None
+
+    req.pdf_link = pdf_link
+    req.render_status = 'ready'
+    return pdf_link
+
+# Put jobs held by crashed workers back on the queue
+def requeue_stale_jobs():
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['COMPILE_JOB_TIMEOUT'])
+
+    requeued = CompileJob.query.filter(
+        CompileJob.status == 'compiling',
+        CompileJob.locked_at < cutoff
+    ).update({'status': 'queued', 'locked_by': None, 'locked_at': None}, synchronize_session=False)
+
+    db.session.commit()
+    return requeued
+
+# Claim the oldest queued job, safe to call from several workers and nodes
+def claim_next_job(worker_id):
+    while True:
+        job = CompileJob.query.filter_by(status='queued').order_by(CompileJob.priority, CompileJob.id).first()
+        if not job:
+            db.session.rollback()
+            return None
+
+        # Only one worker can move the job out of the queued state
+        claimed = CompileJob.query.filter_by(id=job.id, status='queued').update({
+            'status': 'compiling',
+            'locked_by': worker_id,
+            'locked_at': datetime.utcnow(),
+            'attempts': CompileJob.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+# Compile the PDF for a claimed job and record the result on the request
+def run_job(job):
+    req = db.session.get(Request, job.request_id)
+    if req is None:
+        job.status = 'failed'
+        job.error = 'Request no longer exists'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return job
+
+    req.render_status = 'compiling'
+    form_data = req.form_data
+    db.session.commit()
+
+    try:
+        pdf_link = GENERATORS[req.request_type](form_data, job.priority)
+
+        if not get_storage('forms').exists(pdf_link):
+            raise RuntimeError(f'pdflatex did not produce {pdf_link}')
+    except CompileRejected:
+        # Compiler is saturated, hand the job back without using up an attempt
+        db.session.rollback()
+        job.status = 'queued'
+        job.attempts = job.attempts - 1
+        job.locked_by = None
+        job.locked_at = None
+        req.render_status = 'queued'
+        db.session.commit()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        job.error = str(e)
+
+        # Retry until the attempt limit is reached
+        if job.attempts < current_app.config['COMPILE_MAX_ATTEMPTS']:
+            job.status = 'queued'
+            job.locked_by = None
+            job.locked_at = None
+            req.render_status = 'queued'
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            req.render_status = 'failed'
+
+        db.session.commit()
+        return job
+
+    job.status = 'ready'
+    job.error = None
+    job.finished_at = datetime.utcnow()
+
+    # Only publish the PDF if the form was not edited while it compiled
+    db.session.refresh(req)
+    if req.form_data == form_data:
+        req.pdf_link = pdf_link
+        req.render_status = 'ready'
+    elif not CompileJob.query.filter(CompileJob.request_id == req.id, CompileJob.id > job.id).count():
+        # Edited without a newer job of its own, render the latest data
+        enqueue_compile(req)
+
+    db.session.commit()
+    return job
+
+# Poll the queue until stopped
+def work(app, worker_id, stop_event):
+    with app.app_context():
+        interval = app.config['COMPILE_POLL_INTERVAL']
+
+        while not stop_event.is_set():
+            try:
+                job = claim_next_job(worker_id)
+                if job is None:
+                    stop_event.wait(interval)
+                    continue
+
+                try:
+                    job = run_job(job)
+                except CompileRejected as e:
+                    stop_event.wait(e.retry_after)
+                    continue
+
+                stats = cache_stats()
+                app.logger.info('Compile job %s for request %s: %s (PDF cache hits %d, misses %d)',
+                    job.id, job.request_id, job.status, stats['hits'], stats['misses'])
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Compile worker %s failed', worker_id)
+                stop_event.wait(interval)
+            finally:
+                db.session.remove()
+
+def _sweep_stale_jobs(app):
+    with app.app_context():
+        try:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                app.logger.warning('Requeued %d compile job(s) of crashed workers', requeued)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Stale compile job sweep failed')
+        finally:
+            db.session.remove()
+
+# Run a pool of worker threads, each node can run its own pool
+def run_worker_pool(app, concurrency, stop_event=None):
+    stop_event = stop_event or threading.Event()
+    node_id = f"{socket.gethostname()}-{os.getpid()}"
+
+    threads = []
+    for i in range(concurrency):
+        worker_id = f"{node_id}-{i}-{uuid.uuid4().hex[:6]}"
+        thread = threading.Thread(target=work, args=(app, worker_id, stop_event), name=f"compile-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    # Reclaim jobs of crashed workers on a timer, a busy queue never leaves the claim loop idle
+    sweep_interval = app.config['COMPILE_STALE_SWEEP_INTERVAL']
+    next_sweep = time.monotonic()
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + sweep_interval
+                _sweep_stale_jobs(app)
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+    for thread in threads:
+        thread.join()
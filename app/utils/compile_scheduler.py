@@ -0,0 +1,93 @@
+import heapq, itertools, math, threading, time
+from contextlib import contextmanager
+from flask import current_app
+
+# Priorities, lower runs first
+PRIORITY_SUBMIT = 0
+PRIORITY_DRAFT = 1
+
+class CompileRejected(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"PDF compiler is busy, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+# Limits how many pdflatex processes run at once in this process
+class CompileScheduler:
+    def __init__(self, max_concurrency, max_waiting, wait_timeout):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+
+        # Moving average of compile time, used for the retry hint
+        self._average_duration = 2.0
+
+    # Seconds until a rejected caller is likely to get a slot
+    def retry_after(self):
+        backlog = len(self._waiting) + 1
+        return max(1, math.ceil(self._average_duration * backlog / self.max_concurrency))
+
+    def acquire(self, priority):
+        with self._cond:
+            if self._running < self.max_concurrency and not self._waiting:
+                self._running += 1
+                return
+
+            # Bounded wait queue, reject right away when it is full
+            if len(self._waiting) >= self.max_waiting:
+                raise CompileRejected(self.retry_after())
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + self.wait_timeout
+
+            while True:
+                if self._waiting[0] == entry and self._running < self.max_concurrency:
+                    heapq.heappop(self._waiting)
+                    self._running += 1
+                    self._cond.notify_all()
+                    return
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    raise CompileRejected(self.retry_after())
+
+                self._cond.wait(remaining)
+
+    def release(self, duration=None):
+        with self._cond:
+            self._running -= 1
+            if duration is not None:
+                self._average_duration = 0.8 * self._average_duration + 0.2 * duration
+            self._cond.notify_all()
+
+    # Hold a compile slot for the duration of the block
+    @contextmanager
+    def slot(self, priority=PRIORITY_SUBMIT):
+        self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self):
+        with self._cond:
+            return {'running': self._running, 'waiting': len(self._waiting), 'max_concurrency': self.max_concurrency}
+
+def init_compile_scheduler(app):
+    app.extensions['compile_scheduler'] = CompileScheduler(
+        app.config['COMPILE_MAX_CONCURRENCY'],
+        app.config['COMPILE_MAX_WAITING'],
+        app.config['COMPILE_WAIT_TIMEOUT']
+    )
+
+def get_scheduler():
+    return current_app.extensions['compile_scheduler']
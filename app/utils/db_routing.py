@@ -0,0 +1,41 @@
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Session that sends the reads of read-only views to the replica bind
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _use_replica(self._db):
+            return self._db.engines['replica']
+
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+def _use_replica(db):
+    if not has_request_context() or not g.get('read_replica') or 'replica' not in db.engines:
+        return False
+
+    # Read your own writes: stay on the primary until the replica has caught up
+    return session.get('replica_sticky_until', 0) < time.time()
+
+# Route the database reads of a view to the replica, when one is configured
+def read_replica(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _track_writes(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        session['replica_sticky_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_writes(db_session):
+    db_session.info.pop('wrote', None)
@@ -1,4 +1,46 @@
-from app.models import Role, User, OrganizationalUnit, db
+from contextlib import contextmanager
+from flask_migrate import upgrade
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import AppState, Role, User, OrganizationalUnit, db
+
+# Bump when the seed data changes, app start warns until flask bootstrap has run
+SEED_VERSION = 1
+
+# MySQL named lock so only one process bootstraps at a time, a no-op on other databases
+@contextmanager
+def advisory_lock(name, timeout):
+    connection = db.engine.connect()
+    dialect = connection.dialect.name
+
+    try:
+        if dialect == 'mysql':
+            if connection.execute(text('SELECT GET_LOCK(:name, :timeout)'), {'name': name, 'timeout': timeout}).scalar() != 1:
+                raise TimeoutError(f'Could not get lock {name} within {timeout} seconds')
+
+        yield
+    finally:
+        if dialect == 'mysql':
+            connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': name})
+        connection.close()
+
+# Migrate the schema and seed roles and units, safe to run again
+def bootstrap_database():
+    upgrade()
+    create_default_roles()
+    create_organizational_units()
+
+    db.session.merge(AppState(key='seed_version', value=str(SEED_VERSION)))
+    db.session.commit()
+
+# Seed version recorded by flask bootstrap, None if it has not run
+def bootstrapped_version():
+    try:
+        state = db.session.get(AppState, 'seed_version')
+        return int(state.value) if state else None
+    except SQLAlchemyError:
+        db.session.rollback()
+        return None
 
 # Create default roles
 def create_default_roles():
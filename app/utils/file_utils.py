@@ -1,6 +1,81 @@
-import os
+import hashlib, os, shutil, subprocess, tempfile, uuid
 from flask import current_app
+from app.utils.storage import get_storage
 
-def create_upload_folders(form_folder, upload_folder):
-    os.makedirs(form_folder, exist_ok=True)
-    os.makedirs(upload_folder, exist_ok=True)
\ No newline at end of file
+# Root for per-compile scratch directories, RAM-backed when available
+def compile_scratch_root():
+    root = current_app.config['COMPILE_SCRATCH_ROOT']
+    if root and os.path.isdir(root):
+        return root
+    return None
+
+# Copy a file into place so readers only ever see the complete file
+def store_file_atomic(source, destination):
+    temp_path = os.path.join(os.path.dirname(destination), f".{os.path.basename(destination)}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Normalize an uploaded signature once: validate, trim, downscale and store a compact PNG
+def save_signature(file):
+    convert = current_app.config['IMAGEMAGICK_CONVERT']
+    identify = current_app.config['IMAGEMAGICK_IDENTIFY']
+    timeout = current_app.config['IMAGEMAGICK_TIMEOUT']
+
+    # Uploads received through UploadStream are already sniffed and hashed, a non-image is refused before any tool runs
+    stream = file.stream
+    if getattr(stream, 'kind', None) is False:
+        return None
+
+    # The same upload normalized with the same settings is stored once under its hash
+    if hasattr(stream, 'sha256'):
+        settings = f"{current_app.config['SIGNATURE_MAX_SIZE']}:{current_app.config['SIGNATURE_BILEVEL']}"
+        unique_filename = hashlib.sha256(f"{stream.sha256.hexdigest()}:{settings}".encode()).hexdigest() + ".png"
+        if get_storage('signatures').exists(unique_filename):
+            return unique_filename
+    else:
+        unique_filename = f"{uuid.uuid4()}.png"
+
+    with tempfile.TemporaryDirectory(prefix="signature-", dir=compile_scratch_root()) as workspace:
+        upload_path = os.path.join(workspace, "upload")
+        file.save(upload_path)
+
+        # Only accept real PNG/JPEG images of a sane size, whatever the extension says
+        try:
+            result = subprocess.run([identify, "-format", "%m %w %h", f"{upload_path}[0]"], capture_output=True, text=True, timeout=timeout)
+            image_format, width, height = result.stdout.split()
+            pixels = int(width) * int(height)
+        except (OSError, subprocess.TimeoutExpired):
+            current_app.logger.exception('ImageMagick identify failed')
+            return None
+        except ValueError:
+            return None
+
+        if image_format not in ('PNG', 'JPEG') or pixels > current_app.config['SIGNATURE_MAX_PIXELS']:
+            return None
+
+        # Grayscale (or bilevel) on white, trimmed to the ink and shrunk to the box the forms print
+        command = [convert, f"{upload_path}[0]", "-auto-orient", "-background", "white", "-alpha", "remove",
+            "-colorspace", "Gray", "-fuzz", "10%", "-trim", "+repage",
+            "-resize", f"{current_app.config['SIGNATURE_MAX_SIZE']}>"]
+        if current_app.config['SIGNATURE_BILEVEL']:
+            command += ["-threshold", "60%", "-type", "Bilevel"]
+        else:
+            command += ["-depth", "8"]
+
+        output = os.path.join(workspace, "signature.png")
+        try:
+            subprocess.run(command + ["-strip", f"PNG:{output}"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            current_app.logger.exception('ImageMagick convert failed')
+            return None
+
+        if not os.path.exists(output):
+            return None
+
+        get_storage('signatures').save_file(unique_filename, output)
+
+    return unique_filename
@@ -0,0 +1,81 @@
+import glob, hashlib, os, subprocess, tempfile, threading
+from flask import current_app
+from app.utils.file_utils import compile_scratch_root, store_file_atomic
+
+# Formats that failed to build in this process, not retried until restart
+_build_lock = threading.Lock()
+_failed_formats = set()
+
+# Format name for a template, changes whenever the preamble changes
+def format_name(template):
+    checksum = hashlib.sha256(template.preamble.encode()).hexdigest()[:12]
+    return f"{template.name}-{checksum}"
+
+def format_path(name):
+    return os.path.join(current_app.config['LATEX_FORMAT_FOLDER'], f"{name}.fmt")
+
+# Dump the template preamble into a precompiled pdflatex format
+def build_format(template):
+    folder = current_app.config['LATEX_FORMAT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+
+    name = format_name(template)
+    if os.path.exists(format_path(name)):
+        return name
+
+    # Build in a scratch directory so other nodes never see a partial format
+    with tempfile.TemporaryDirectory(prefix="format-", dir=compile_scratch_root()) as workspace:
+        preamble_path = os.path.join(workspace, f"{name}.tex")
+        with open(preamble_path, "w") as file:
+            file.write(template.preamble + "\\begin{document}\n\\end{document}\n")
+
+        subprocess.run(["pdflatex", "-ini", "-interaction=nonstopmode", f"-jobname={name}",
+            "&pdflatex", "mylatexformat.ltx", preamble_path], cwd=workspace, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        built = os.path.join(workspace, f"{name}.fmt")
+        if os.path.exists(built):
+            store_file_atomic(built, format_path(name))
+
+            # Remove formats built from older versions of the template
+            for old in glob.glob(os.path.join(folder, f"{template.name}-*.fmt")):
+                if old != format_path(name):
+                    os.remove(old)
+
+    return name if os.path.exists(format_path(name)) else None
+
+# Precompiled format for a template, built on first use
+def get_format(template):
+    if not current_app.config['LATEX_USE_FORMATS'] or template.preamble is None:
+        return None
+
+    name = format_name(template)
+    if os.path.exists(format_path(name)):
+        return name
+
+    with _build_lock:
+        if name in _failed_formats:
+            return None
+
+        built = build_format(template)
+        if not built:
+            _failed_formats.add(name)
+            current_app.logger.warning('Could not build LaTeX format %s, compiling without it', name)
+
+        return built
+
+# Mark a format as unusable, e.g. when a compile with it produced no PDF
+def discard_format(name):
+    with _build_lock:
+        _failed_formats.add(name)
+
+# Run pdflatex on a file, starting from a precompiled format if one is given
+def run_pdflatex(tex_file_path, output_dir, fmt=None):
+    command = ["pdflatex", "-interaction=nonstopmode"]
+    env = None
+
+    if fmt:
+        command.append(f"-fmt={fmt}")
+        env = dict(os.environ, TEXFORMATS=current_app.config['LATEX_FORMAT_FOLDER'] + os.pathsep)
+
+    command += ["-output-directory", output_dir, tex_file_path]
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
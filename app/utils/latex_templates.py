@@ -0,0 +1,76 @@
+import hashlib, re
+
+# Placeholders look like {{NAME}}
+PLACEHOLDER = re.compile(r'\{\{([A-Z_]+)\}\}')
+
+# Characters with a special meaning in LaTeX, translated in a single pass
+LATEX_ESCAPES = str.maketrans({
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+})
+
+class TemplateError(Exception):
+    pass
+
+# Escape a user supplied value for LaTeX
+def escape_latex(value):
+    if value is None:
+        return ''
+    return str(value).translate(LATEX_ESCAPES)
+
+# A form template parsed once into literal text and placeholder segments
+class FormTemplate:
+    def __init__(self, name, source, fields, raw_fields=()):
+        self.name = name
+        self.checksum = hashlib.sha256(source.encode()).hexdigest()
+        self.fields = frozenset(fields)
+        self.raw_fields = frozenset(raw_fields)
+
+        # Literals and keys alternate: literal, key, literal, key, ..., literal
+        pieces = PLACEHOLDER.split(source)
+        self.literals = pieces[0::2]
+        self.keys = pieces[1::2]
+
+        # The template and the declared fields must agree
+        found = set(self.keys)
+        unknown = found - self.fields
+        missing = self.fields - found
+
+        if unknown:
+            raise TemplateError(f"{name}: unknown placeholders {', '.join(sorted(unknown))}")
+        if missing:
+            raise TemplateError(f"{name}: missing placeholders {', '.join(sorted(missing))}")
+
+    # Everything before \begin{document}, identical for every render of the template
+    @property
+    def preamble(self):
+        head = self.literals[0]
+        index = head.find('\\begin{document}')
+        return head[:index] if index != -1 else None
+
+    @classmethod
+    def from_file(cls, name, path, fields, raw_fields=()):
+        with open(path, "r") as file:
+            return cls(name, file.read(), fields, raw_fields)
+
+    # Substitute the values into the template in one pass
+    def render(self, data):
+        parts = [self.literals[0]]
+
+        for key, literal in zip(self.keys, self.literals[1:]):
+            value = data.get(key)
+            if key in self.raw_fields:
+                parts.append('' if value is None else str(value))
+            else:
+                parts.append(escape_latex(value))
+            parts.append(literal)
+
+        return ''.join(parts)
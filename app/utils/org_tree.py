@@ -0,0 +1,105 @@
+import threading, time, uuid
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import AppState, OrganizationalUnit, db
+
+# app_state key whose value changes in the same transaction as any unit change
+ORG_TREE_VERSION = 'org_tree_version'
+
+UnitNode = namedtuple('UnitNode', ['id', 'name', 'parent_id', 'manager_id'])
+
+# Unit lookups by id and name without touching the database
+class OrgTree:
+    def __init__(self, units, version):
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.by_id = {}
+        self.by_name = {}
+
+        for unit_id, name, parent_id, manager_id in units:
+            node = UnitNode(unit_id, name, parent_id, manager_id)
+            self.by_id[unit_id] = node
+            self.by_name.setdefault(name, node)
+
+    def get(self, unit_id):
+        return self.by_id.get(unit_id)
+
+    def by_unit_name(self, name):
+        return self.by_name.get(name)
+
+    def parent(self, unit_id):
+        node = self.by_id.get(unit_id)
+        return self.by_id.get(node.parent_id) if node and node.parent_id else None
+
+    # Ancestor chain from the parent up to the root, walked through parent_id and safe against cycles
+    def ancestors(self, unit_id):
+        chain, seen = [], {unit_id}
+        node = self.parent(unit_id)
+        while node and node.id not in seen:
+            chain.append(node)
+            seen.add(node.id)
+            node = self.parent(node.id)
+        return chain
+
+_tree_lock = threading.Lock()
+_tree = None
+
+def _stored_version():
+    return db.session.execute(db.select(AppState.value).filter_by(key=ORG_TREE_VERSION)).scalar()
+
+# Load the whole tree, the version is read first so a change committed in between only causes another reload
+def load_org_tree():
+    version = _stored_version()
+    units = db.session.execute(db.select(
+        OrganizationalUnit.id, OrganizationalUnit.name, OrganizationalUnit.parent_id, OrganizationalUnit.manager_id
+    )).all()
+
+    return OrgTree(units, version)
+
+# Process-wide tree, trusted for ORG_TREE_TTL seconds, then kept only if the stored version still matches
+def get_org_tree():
+    global _tree
+
+    tree = _tree
+    if tree is not None and time.monotonic() - tree.checked_at <= current_app.config['ORG_TREE_TTL']:
+        return tree
+
+    with _tree_lock:
+        tree = _tree
+        if tree is None:
+            tree = _tree = load_org_tree()
+        elif time.monotonic() - tree.checked_at > current_app.config['ORG_TREE_TTL']:
+            if _stored_version() == tree.version:
+                tree.checked_at = time.monotonic()
+            else:
+                tree = _tree = load_org_tree()
+
+    return tree
+
+def invalidate_org_tree():
+    global _tree
+    _tree = None
+
+def _changes_units(session):
+    if any(isinstance(obj, OrganizationalUnit) for obj in (*session.new, *session.deleted)):
+        return True
+    return any(isinstance(obj, OrganizationalUnit) and session.is_modified(obj, include_collections=False) for obj in session.dirty)
+
+# A flush that adds, changes or removes a unit writes a new version, so other processes see it on their next check
+@event.listens_for(Session, 'before_flush')
+def _bump_tree_version(session, flush_context, instances):
+    if _changes_units(session):
+        session.merge(AppState(key=ORG_TREE_VERSION, value=uuid.uuid4().hex))
+        session.info['org_tree_changed'] = True
+
+# This process drops its tree as soon as the change is committed
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('org_tree_changed', False):
+        invalidate_org_tree()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_unit_changes(session):
+    session.info.pop('org_tree_changed', None)
@@ -0,0 +1,207 @@
+import io, json, os, subprocess, tempfile, threading
+from flask import current_app
+from app.utils.file_utils import compile_scratch_root, store_file_atomic
+from app.utils.compile_scheduler import get_scheduler
+
+# pypdf and reportlab are only needed when a template uses the overlay engine
+try:
+    from pypdf import PdfReader, PdfWriter
+    from reportlab.pdfgen import canvas
+    OVERLAY_AVAILABLE = True
+except ImportError:
+    OVERLAY_AVAILABLE = False
+
+# Scaled points per PostScript point, the unit of \pdflastxpos
+SP_PER_BP = 65536 * 72.27 / 72
+
+# 5cm, the signature width used by every template
+SIGNATURE_WIDTH = 5 / 2.54 * 72
+
+# Macros for the base compile: every placeholder records its position instead of printing a value
+BASE_MACROS = r"""
+\newwrite\formfields
+\immediate\openout\formfields=\jobname.fields
+\newcommand{\FormField}[1]{\pdfsavepos\write\formfields{#1 \thepage\space\the\pdflastxpos\space\the\pdflastypos}}
+\providecommand{\CheckedBox}[1]{}
+\renewcommand{\CheckedBox}[1]{#1\phantom{$\square$}}
+\providecommand{\includegraphics}[2][]{}
+\renewcommand{\includegraphics}[2][]{#2\rule{0pt}{%(height).2fbp}\hspace{%(width).2fbp}}
+"""
+
+# Loaded base PDFs and field positions, bases that failed to build and per-template build locks, keyed by template checksum
+_base_lock = threading.Lock()
+_base_locks = {}
+_bases = {}
+_failed_bases = set()
+
+# Kind of each placeholder: checkbox, image, bold or text
+def field_kinds(template):
+    kinds = {}
+    for key, literal in zip(template.keys, template.literals):
+        line = literal.rsplit('\n', 1)[-1]
+
+        if line.endswith('\\CheckedBox{'):
+            kinds[key] = 'checkbox'
+        elif key in template.raw_fields:
+            kinds[key] = 'image'
+        elif '\\textbf{' in line:
+            kinds[key] = 'bold'
+        else:
+            kinds[key] = 'text'
+
+    return kinds
+
+# Template source with position markers in place of the values
+def base_source(template):
+    preamble = template.preamble
+    macros = BASE_MACROS % {
+        'width': SIGNATURE_WIDTH,
+        'height': SIGNATURE_WIDTH / current_app.config['SIGNATURE_ASPECT']
+    }
+
+    parts = [template.literals[0]]
+    for key, literal in zip(template.keys, template.literals[1:]):
+        parts.append(f"\\FormField{{{key}}}")
+        parts.append(literal)
+    source = ''.join(parts)
+
+    return preamble + macros + source[len(preamble):]
+
+def _base_paths(template):
+    folder = current_app.config['OVERLAY_FOLDER']
+    name = f"{template.name}-{template.checksum[:12]}"
+    return os.path.join(folder, f"{name}.pdf"), os.path.join(folder, f"{name}.json")
+
+# Compile the template once into a base PDF and record where each field goes
+def build_base(template):
+    pdf_path, fields_path = _base_paths(template)
+    if os.path.exists(pdf_path) and os.path.exists(fields_path):
+        return pdf_path, fields_path
+
+    os.makedirs(current_app.config['OVERLAY_FOLDER'], exist_ok=True)
+
+    with tempfile.TemporaryDirectory(prefix="overlay-", dir=compile_scratch_root()) as workspace:
+        tex_file_path = os.path.join(workspace, "base.tex")
+        with open(tex_file_path, "w") as file:
+            file.write(base_source(template))
+
+        subprocess.run(["pdflatex", "-interaction=nonstopmode", "-output-directory", workspace, tex_file_path],
+            cwd=workspace, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        output = os.path.join(workspace, "base.pdf")
+        positions = os.path.join(workspace, "base.fields")
+        if not os.path.exists(output) or not os.path.exists(positions):
+            return None
+
+        # Field name, page, x and y in scaled points from the bottom left corner
+        kinds = field_kinds(template)
+        fields = []
+        with open(positions) as file:
+            for line in file:
+                key, page, x, y = line.split()
+                fields.append({
+                    'key': key,
+                    'kind': kinds[key],
+                    'page': int(page) - 1,
+                    'x': int(x.rstrip('sp')) / SP_PER_BP,
+                    'y': int(y.rstrip('sp')) / SP_PER_BP
+                })
+
+        fields_output = os.path.join(workspace, "base.json")
+        with open(fields_output, "w") as file:
+            json.dump(fields, file)
+
+        store_file_atomic(output, pdf_path)
+        store_file_atomic(fields_output, fields_path)
+
+    return pdf_path, fields_path
+
+# One lock per template, a base build only holds up renders of its own template
+def _template_lock(template):
+    with _base_lock:
+        return _base_locks.setdefault(template.checksum, threading.Lock())
+
+def _load_base(template):
+    loaded = _bases.get(template.checksum)
+    if loaded is not None:
+        return loaded
+
+    with _template_lock(template):
+        if template.checksum in _failed_bases:
+            return None
+
+        if template.checksum not in _bases:
+            # The one-off base build is a normal pdflatex run
+            with get_scheduler().slot():
+                paths = build_base(template)
+
+            if paths is None:
+                _failed_bases.add(template.checksum)
+                current_app.logger.warning('Could not build overlay base for %s, using pdflatex', template.name)
+                return None
+
+            with open(paths[0], "rb") as file:
+                pdf = file.read()
+            with open(paths[1]) as file:
+                fields = json.load(file)
+
+            with _base_lock:
+                _bases[template.checksum] = (pdf, fields)
+
+        return _bases[template.checksum]
+
+# Whether the overlay engine can be used for a template, without building anything
+def overlay_enabled(template):
+    return OVERLAY_AVAILABLE and template.checksum not in _failed_bases
+
+def _draw_checkbox(pdf, x, y, checked, size=8):
+    pdf.setLineWidth(0.5)
+    pdf.rect(x, y, size, size)
+    if checked:
+        pdf.line(x, y, x + size, y + size)
+        pdf.line(x, y + size, x + size, y)
+
+# Draw the field values on a transparent layer and merge it onto the base PDF
+def render_overlay(template, data, output_path):
+    loaded = _load_base(template)
+    if loaded is None:
+        return False
+
+    base_pdf, fields = loaded
+    base = PdfReader(io.BytesIO(base_pdf))
+    font_size = current_app.config['OVERLAY_FONT_SIZE']
+
+    layer = io.BytesIO()
+    pdf = canvas.Canvas(layer)
+    for index, page in enumerate(base.pages):
+        pdf.setPageSize((float(page.mediabox.width), float(page.mediabox.height)))
+
+        for field in fields:
+            if field['page'] != index:
+                continue
+
+            value = data.get(field['key'])
+            if field['kind'] == 'checkbox':
+                _draw_checkbox(pdf, field['x'], field['y'], value == 'yes')
+            elif field['kind'] == 'image':
+                if value and os.path.exists(value):
+                    height = SIGNATURE_WIDTH / current_app.config['SIGNATURE_ASPECT']
+                    pdf.drawImage(value, field['x'], field['y'], SIGNATURE_WIDTH, height,
+                        preserveAspectRatio=True, anchor='sw', mask='auto')
+            elif value:
+                pdf.setFont('Helvetica-Bold' if field['kind'] == 'bold' else 'Helvetica', font_size)
+                pdf.drawString(field['x'], field['y'], str(value))
+
+        pdf.showPage()
+    pdf.save()
+
+    overlay = PdfReader(io.BytesIO(layer.getvalue()))
+    writer = PdfWriter()
+    for page, overlay_page in zip(base.pages, overlay.pages):
+        page.merge_page(overlay_page)
+        writer.add_page(page)
+
+    with open(output_path, "wb") as file:
+        writer.write(file)
+
+    return True
@@ -0,0 +1,89 @@
+import base64, binascii, json
+from datetime import datetime
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_
+
+# One page of a keyset paginated listing
+class KeysetPage:
+    def __init__(self, items, next_url, prev_url):
+        self.items = items
+        self.next_url = next_url
+        self.prev_url = prev_url
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def _encode_value(value):
+    return {'dt': value.isoformat()} if isinstance(value, datetime) else value
+
+def _decode_value(value):
+    return datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+
+# Opaque cursor holding the sort key of a row
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps([_encode_value(value) for value in values]).encode()).decode()
+
+# Sort key from a cursor, None if it is missing or malformed
+def decode_cursor(token, length):
+    if not token:
+        return None
+
+    try:
+        values = [_decode_value(value) for value in json.loads(base64.urlsafe_b64decode(token.encode()))]
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeDecodeError):
+        return None
+
+    return values if len(values) == length else None
+
+# Rows past the cursor in the given direction, spelled out so indexes on the columns apply
+def _beyond(columns, values, descending):
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+# Requested page size, capped by MAX_PAGE_SIZE
+def page_size(prefix=''):
+    size = request.args.get(f'{prefix}per_page', current_app.config['PAGE_SIZE'], type=int)
+    return min(max(size, 1), current_app.config['MAX_PAGE_SIZE'])
+
+def _page_url(prefix, direction, cursor):
+    args = request.args.to_dict()
+    args.pop(f'{prefix}after', None)
+    args.pop(f'{prefix}before', None)
+    args[f'{prefix}{direction}'] = cursor
+    return url_for(request.endpoint, **request.view_args, **args)
+
+# Page of a query ordered by columns, the last one unique, with key(row) giving the row's values for them.
+# The cursor comes from the <prefix>after and <prefix>before arguments so one view can page several lists.
+def keyset_paginate(query, columns, key, descending=True, prefix=''):
+    per_page = page_size(prefix)
+    after = decode_cursor(request.args.get(f'{prefix}after'), len(columns))
+    before = decode_cursor(request.args.get(f'{prefix}before'), len(columns)) if after is None else None
+
+    # Going back walks the index the other way, then the rows are flipped into display order
+    backwards = before is not None
+    cursor = before if backwards else after
+    reverse = descending != backwards
+
+    if cursor is not None:
+        query = query.filter(_beyond(columns, cursor, reverse))
+
+    rows = query.order_by(*[column.desc() if reverse else column.asc() for column in columns]).limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, cursor is not None
+
+    next_url = _page_url(prefix, 'after', encode_cursor(key(rows[-1]))) if rows and has_next else None
+    prev_url = _page_url(prefix, 'before', encode_cursor(key(rows[0]))) if rows and has_prev else None
+
+    return KeysetPage(rows, next_url, prev_url)
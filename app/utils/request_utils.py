@@ -1,5 +1,89 @@
-import os, tempfile, subprocess, shutil, uuid
+import os, hashlib, json, re, tempfile, threading
+from collections import OrderedDict
 from flask import current_app
+from app.models import RequestType
+from app.utils.file_utils import compile_scratch_root
+from app.utils.storage import get_storage, signature_key
+from app.utils.latex_templates import FormTemplate
+from app.utils.latex_formats import get_format, discard_format, run_pdflatex
+from app.utils.compile_scheduler import get_scheduler, PRIORITY_SUBMIT
+from app.utils.overlay_renderer import overlay_enabled, render_overlay
+
+# Placeholders used by each form template
+FERPA_FIELDS = (
+    "NAME", "CAMPUS",
+    "OPT_REGISTRAR", "OPT_AID", "OPT_FINANCIAL", "OPT_UNDERGRAD", "OPT_ADVANCEMENT", "OPT_DEAN", "OPT_OTHER_OFFICIALS", "OTHEROFFICIALS",
+    "OPT_ACADEMIC_INFO", "OPT_UNIVERSITY_RECORDS", "OPT_ACADEMIC_RECORDS", "OPT_BILLING", "OPT_DISCIPLINARY",
+    "OPT_TRANSCRIPTS", "OPT_HOUSING", "OPT_PHOTOS", "OPT_SCHOLARSHIP", "OPT_OTHER_INFO", "OTHERINFO",
+    "RELEASE", "PURPOSE", "ADDITIONALS",
+    "OPT_FAMILY", "OPT_INSTITUTION", "OPT_HONOR", "OPT_EMPLOYER", "OPT_PUBLIC", "OPT_OTHER_RELEASE", "OTHERRELEASE",
+    "PASSWORD", "PEOPLESOFT", "SIGNATURE", "DATE"
+)
+
+NAME_SSN_FIELDS = (
+    "NAME", "PEOPLESOFT", "EDIT_NAME", "EDIT_SSN",
+    "FN_OLD", "MN_OLD", "LN_OLD", "SUF_OLD",
+    "FN_NEW", "MN_NEW", "LN_NEW", "SUF_NEW",
+    "OPT_MARITAL", "OPT_COURT", "OPT_ERROR_NAME",
+    "SSN_OLD", "SSN_NEW", "OPT_ERROR_SSN", "OPT_ADD_SSN",
+    "SIGNATURE", "DATE"
+)
+
+WITHDRAWAL_FIELDS = (
+    "NAME", "PEOPLESOFT", "COLLEGE", "DEGREE",
+    "ADDRESS", "CITY", "STATE", "ZIPCODE", "PHONE", "EMAIL",
+    "TERMYEAR", "LASTATTENDED", "REASON", "DETAILS",
+    "FINANCIALASSISTANCE", "HEALTHINSURANCE", "CAMPUSHOUSING", "VISASTATUS", "GIBILL",
+    "SUBJECT", "NUMBER", "SECTION", "SIGNATURE", "DATE"
+)
+
+DROP_FIELDS = (
+    "NAME", "PEOPLESOFT", "BIRTHDATE", "TERMYEAR",
+    "SUBJECT", "NUMBER", "SECTION", "SIGNATURE", "DATE"
+)
+
+# Template file, output file prefix and placeholders for each form
+FORM_TEMPLATES = {
+    'ferpa': ('ferpa.tex', 'ferpa_form', FERPA_FIELDS),
+    'name_ssn_change': ('name_ssn_change.tex', 'name_form', NAME_SSN_FIELDS),
+    'medical_withdrawal': ('medical_withdrawal.tex', 'withdrawal_form', WITHDRAWAL_FIELDS),
+    'student_drop': ('student_drop.tex', 'drop_form', DROP_FIELDS),
+}
+
+# Form template used by each request type
+REQUEST_TEMPLATES = {
+    RequestType.FERPA: 'ferpa',
+    RequestType.INFO: 'name_ssn_change',
+    RequestType.MEDICAL: 'medical_withdrawal',
+    RequestType.DROP: 'student_drop',
+}
+
+# The signature is a storage key, fetched into the compile workspace and passed to \includegraphics as a path, never escaped
+RAW_FIELDS = ("SIGNATURE",)
+
+# Bump when the rendering changes in a way the template checksum does not cover
+RENDER_VERSION = "2"
+
+# PDF cache hit/miss counters for this process
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+# save_signature names a signature after the hash of its upload and normalization settings
+CONTENT_ADDRESSED_SIGNATURE = re.compile(r'[0-9a-f]{64}\.png')
+
+# Digests of older, randomly named signatures; stored signatures are never rewritten, so a digest holds for good
+SIGNATURE_DIGEST_CACHE_SIZE = 4096
+_digest_lock = threading.Lock()
+_signature_digests = OrderedDict()
+
+# Parse every form template once at startup
+def load_form_templates(app):
+    template_dir = os.path.join(app.config['BASE_DIR'], 'uploads', 'form-templates')
+
+    app.extensions['form_templates'] = {
+        name: FormTemplate.from_file(name, os.path.join(template_dir, filename), fields, RAW_FIELDS)
+        for name, (filename, _, fields) in FORM_TEMPLATES.items()
+    }
 
 # Check if file is allowed
 def allowed_file(filename):
@@ -16,115 +100,161 @@ def return_choice_bool(choice):
         return "Yes"
     return "No"
 
-def generate_ferpa(data):
-    # Custom LaTeX file path
-    FERPA_FILE = os.path.join(current_app.config['BASE_DIR'], 'uploads', 'form-templates', 'ferpa.tex')
-
-    # Generate unique ID for the PDF
-    unique_id = str(uuid.uuid4())
-
-    # Unique file paths
-    tex_file_path = os.path.join(current_app.config['FORM_FOLDER'], f"ferpa_form_{unique_id}.tex")
-    pdf_file_path = f"ferpa_form_{unique_id}.pdf"
-    
-    # Read the LaTeX template and replace placeholders
-    with open(FERPA_FILE, "r") as file:
-        latex_content = file.read()
-
-    for key, value in data.items():
-        latex_content = latex_content.replace(f"{{{{{key}}}}}", value)
-
-    # Save the modified LaTeX file
+def cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats)
+
+def _count_cache(hit):
+    with _cache_lock:
+        _cache_stats['hits' if hit else 'misses'] += 1
+
+# Render engine for a template: pdflatex, or the TeX-free overlay when configured
+def render_engine(template_name):
+    template = current_app.extensions['form_templates'][template_name]
+    engine = current_app.config['FORM_RENDER_ENGINES'].get(template_name, 'tex')
+
+    if engine == 'overlay' and overlay_enabled(template):
+        return 'overlay'
+    return 'tex'
+
+# Content hash of a render: engine, template version, normalized form data and signature image
+def render_key(template, data, engine='tex'):
+    digest = hashlib.sha256()
+    digest.update(RENDER_VERSION.encode())
+    digest.update(engine.encode())
+    digest.update(template.checksum.encode())
+
+    # Only the fields the template uses, the signature path changes on every upload
+    fields = {key: '' if data.get(key) is None else str(data.get(key))
+              for key in template.fields - template.raw_fields}
+    digest.update(json.dumps(fields, sort_keys=True).encode())
+
+    signature = data.get("SIGNATURE")
+    if signature:
+        digest.update((signature_digest(signature) or '').encode())
+
+    return digest.hexdigest()
+
+# Content digest of a stored signature: the key itself when it is content-addressed,
+# otherwise the file is read once per process and the digest kept in a small LRU
+def signature_digest(signature):
+    key = signature_key(signature)
+    if CONTENT_ADDRESSED_SIGNATURE.fullmatch(key):
+        return key
+
+    with _digest_lock:
+        if key in _signature_digests:
+            _signature_digests.move_to_end(key)
+            return _signature_digests[key]
+
+    digest = hashlib.sha256()
+    try:
+        for chunk in get_storage('signatures').open(key):
+            digest.update(chunk)
+    except FileNotFoundError:
+        return None
+
+    with _digest_lock:
+        _signature_digests[key] = digest.hexdigest()
+        if len(_signature_digests) > SIGNATURE_DIGEST_CACHE_SIZE:
+            _signature_digests.popitem(last=False)
+
+    return digest.hexdigest()
+
+# Content-addressed PDF filename for a render, by default with the engine that would render it now
+def pdf_filename(template_name, data, engine=None):
+    template = current_app.extensions['form_templates'][template_name]
+    prefix = FORM_TEMPLATES[template_name][1]
+    return f"{prefix}_{render_key(template, data, engine or render_engine(template_name))}.pdf"
+
+# Return the PDF if an identical render already exists
+def cached_pdf(template_name, data):
+    pdf_file_path = pdf_filename(template_name, data)
+    hit = get_storage('forms').exists(pdf_file_path)
+    _count_cache(hit)
+
+    return pdf_file_path if hit else None
+
+# Copy the signature into the workspace and point the form data at the local copy
+def _local_signature(data, workspace):
+    signature = data.get("SIGNATURE")
+    if not signature:
+        return data
+
+    key = signature_key(signature)
+    path = os.path.join(workspace, key)
+    try:
+        get_storage('signatures').fetch(key, path)
+    except FileNotFoundError:
+        return data
+
+    return dict(data, SIGNATURE=path.replace("\\", "/"))
+
+# Compile the rendered LaTeX in a workspace, starting from the precompiled preamble when available
+def _compile_tex(template, data, workspace, priority):
+    tex_file_path = os.path.join(workspace, f"{template.name}.tex")
+    output = os.path.join(workspace, f"{template.name}.pdf")
+
+    # Save the rendered LaTeX file
     with open(tex_file_path, "w") as file:
-        file.write(latex_content)
+        file.write(template.render(data))
 
-    # Compile
-    subprocess.run(["pdflatex", "-interaction=nonstopmode", "-output-directory", current_app.config['FORM_FOLDER'], tex_file_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Compile in a scheduler slot
+    with get_scheduler().slot(priority):
+        fmt = get_format(template)
+        run_pdflatex(tex_file_path, workspace, fmt)
 
-    # Return path to PDF
-    return pdf_file_path
+        # Fall back to a full compile if the format did not work
+        if fmt and not os.path.exists(output):
+            discard_format(fmt)
+            run_pdflatex(tex_file_path, workspace)
 
-def generate_ssn_name(data):
-    # Custom LaTeX file path
-    NAME_SSN_FILE = os.path.join(current_app.config['BASE_DIR'], 'uploads', 'form-templates', 'name_ssn_change.tex') 
+    return output
 
-    # Generate unique ID for the PDF
-    unique_id = str(uuid.uuid4())
+# Render a form template and compile it to PDF, reusing an identical earlier render
+def compile_form(template_name, data, priority=PRIORITY_SUBMIT):
+    pdf_file_path = cached_pdf(template_name, data)
+    if pdf_file_path:
+        return pdf_file_path
 
-    # Unique file paths
-    tex_file_path = os.path.join(current_app.config['FORM_FOLDER'], f"name_form_{unique_id}.tex")
-    pdf_file_path = f"name_form_{unique_id}.pdf"
+    template = current_app.extensions['form_templates'][template_name]
+    engine = render_engine(template_name)
 
-    # Read the LaTeX template and replace placeholders
-    with open(NAME_SSN_FILE, "r") as file:
-        latex_content = file.read()
+    # Render in a private scratch directory that is removed afterwards
+    with tempfile.TemporaryDirectory(prefix="compile-", dir=compile_scratch_root()) as workspace:
+        output = os.path.join(workspace, f"{template_name}.pdf")
+        local_data = _local_signature(data, workspace)
 
-    for key, value in data.items():
-        latex_content = latex_content.replace(f"{{{{{key}}}}}", value)
-
-    # Save the modified LaTeX file
-    with open(tex_file_path, "w") as file:
-        file.write(latex_content)
-
-    # Compile
-    subprocess.run(["pdflatex", "-interaction=nonstopmode", "-output-directory", current_app.config['FORM_FOLDER'], tex_file_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    # Return the generated PDF
-    return pdf_file_path
+        # The overlay engine needs no TeX run once its base PDF exists, any overlay failure falls back to pdflatex
+        rendered = False
+        if engine == 'overlay':
+            try:
+                rendered = render_overlay(template, local_data, output)
+            except Exception:
+                current_app.logger.exception('Overlay render of %s failed, using pdflatex', template_name)
 
-def generate_withdrawal(data):
-    # Custom LaTeX file path
-    NAME_WITHDRAWAL_FILE = os.path.join(current_app.config['BASE_DIR'], 'uploads', 'form-templates', 'medical_withdrawal.tex')
+        if not rendered:
+            engine = 'tex'
+            output = _compile_tex(template, local_data, workspace, priority)
 
-    # Generate unique ID for the PDF
-    unique_id = str(uuid.uuid4())
+        # Name the PDF after the engine that actually rendered it
+        pdf_file_path = pdf_filename(template_name, data, engine)
 
-    # Unique file paths
-    tex_file_path = os.path.join(current_app.config['FORM_FOLDER'], f"withdrawal_form_{unique_id}.tex")
-    pdf_file_path = f"withdrawal_form_{unique_id}.pdf"
+        # Publish only the finished PDF under its content-addressed name
+        if os.path.exists(output):
+            get_storage('forms').save_file(pdf_file_path, output)
 
-    # Read the LaTeX template and replace placeholders
-    with open(NAME_WITHDRAWAL_FILE, "r") as file:
-        latex_content = file.read()
-
-    for key, value in data.items():
-        latex_content = latex_content.replace(f"{{{{{key}}}}}", value)
-    
-    # Save the modified LaTeX file
-    with open(tex_file_path, "w") as file:
-        file.write(latex_content)
-
-    # Compile
-    subprocess.run(["pdflatex", "-interaction=nonstopmode", "-output-directory", current_app.config['FORM_FOLDER'], tex_file_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    # Return the generated PDF
+    # Return path to PDF
     return pdf_file_path
 
+def generate_ferpa(data, priority=PRIORITY_SUBMIT):
+    return compile_form('ferpa', data, priority)
 
-def generate_drop(data):
-    # Custom LaTeX file path
-    STUDENT_DROP_FILE = os.path.join(current_app.config['BASE_DIR'], 'uploads', 'form-templates', 'student_drop.tex')
-
-    # Generate unique ID for the PDF
-    unique_id = str(uuid.uuid4())
-
-    # Unique file paths
-    tex_file_path = os.path.join(current_app.config['FORM_FOLDER'], f"drop_form_{unique_id}.tex")
-    pdf_file_path = f"drop_form_{unique_id}.pdf"
-
-    # Read the LaTeX template and replace placeholders
-    with open(STUDENT_DROP_FILE, "r") as file:
-        latex_content = file.read()
-
-    for key, value in data.items():
-        latex_content = latex_content.replace(f"{{{{{key}}}}}", value)
-    
-    # Save the modified LaTeX file
-    with open(tex_file_path, "w") as file:
-        file.write(latex_content)
+def generate_ssn_name(data, priority=PRIORITY_SUBMIT):
+    return compile_form('name_ssn_change', data, priority)
 
-    # Compile
-    subprocess.run(["pdflatex", "-interaction=nonstopmode", "-output-directory", current_app.config['FORM_FOLDER'], tex_file_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+def generate_withdrawal(data, priority=PRIORITY_SUBMIT):
+    return compile_form('medical_withdrawal', data, priority)
 
-    # Return the generated PDF
-    return pdf_file_path
\ No newline at end of file
+def generate_drop(data, priority=PRIORITY_SUBMIT):
+    return compile_form('student_drop', data, priority)
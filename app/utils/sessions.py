@@ -0,0 +1,181 @@
+import secrets, threading, time
+from datetime import datetime, timedelta
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import CallbackDict
+
+# redis is only needed for SESSION_TYPE=redis
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Session data kept on the server, the cookie only carries its random id
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.regenerate = False
+
+# Sessions in a database table, read and written on their own connection so they never commit view changes
+class SqlSessionStore:
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def table(self):
+        from app.models import UserSession
+        return UserSession.__table__
+
+    def get(self, sid):
+        with self.db.engine.connect() as connection:
+            row = connection.execute(self.table.select().where(self.table.c.id == sid, self.table.c.expires_at > datetime.utcnow())).first()
+        return row.data if row else None
+
+    def set(self, sid, data, lifetime):
+        values = {'data': data, 'expires_at': datetime.utcnow() + timedelta(seconds=lifetime)}
+
+        with self.db.engine.begin() as connection:
+            if connection.execute(self.table.update().where(self.table.c.id == sid).values(**values)).rowcount:
+                return
+
+        # New session, or one written by a parallel request in the meantime
+        try:
+            with self.db.engine.begin() as connection:
+                connection.execute(self.table.insert().values(id=sid, **values))
+        except IntegrityError:
+            with self.db.engine.begin() as connection:
+                connection.execute(self.table.update().where(self.table.c.id == sid).values(**values))
+
+    def delete(self, sid):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.id == sid))
+
+    def purge(self):
+        with self.db.engine.begin() as connection:
+            return connection.execute(self.table.delete().where(self.table.c.expires_at <= datetime.utcnow())).rowcount
+
+# Sessions in Redis or a compatible server, which expires them itself
+class RedisSessionStore:
+    def __init__(self, client, prefix='session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, sid):
+        data = self.client.get(self.prefix + sid)
+        return data.decode() if isinstance(data, bytes) else data
+
+    def set(self, sid, data, lifetime):
+        self.client.setex(self.prefix + sid, lifetime, data)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+    def purge(self):
+        return 0
+
+# Sessions in this process only, for tests and single-process development
+class MemorySessionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def get(self, sid):
+        with self._lock:
+            data, expires = self._sessions.get(sid, (None, 0))
+        return data if expires > time.time() else None
+
+    def set(self, sid, data, lifetime):
+        with self._lock:
+            self._sessions[sid] = (data, time.time() + lifetime)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._sessions.items() if expires <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Emptied session, e.g. on logout: drop the record and the cookie
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                    secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app), samesite=self.get_cookie_samesite(app))
+                response.vary.add('Cookie')
+            return
+
+        # A new id after login so an id planted before it is worthless
+        if session.regenerate:
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.modified = True
+
+        if not (session.modified or self.should_set_cookie(app, session)):
+            return
+
+        response.vary.add('Cookie')
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), lifetime)
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+# Session store picked by SESSION_TYPE, 'cookie' keeps Flask's signed cookie sessions
+def init_sessions(app):
+    from app.models import db
+
+    session_type = app.config['SESSION_TYPE']
+    if session_type == 'cookie':
+        return
+
+    if session_type == 'sql':
+        store = SqlSessionStore(db)
+    elif session_type == 'redis':
+        if not REDIS_AVAILABLE:
+            raise RuntimeError('redis is required for SESSION_TYPE=redis')
+        store = RedisSessionStore(redis.Redis.from_url(app.config['SESSION_REDIS_URL']))
+    elif session_type == 'memory':
+        store = MemorySessionStore()
+    else:
+        raise RuntimeError(f'Unknown SESSION_TYPE {session_type}')
+
+    app.session_interface = ServerSideSessionInterface(store)
+
+# Give the session a new id when it is next saved, call on login
+def regenerate_session(session):
+    if isinstance(session, ServerSideSession):
+        session.regenerate = True
@@ -0,0 +1,229 @@
+import hashlib, os, shutil, uuid
+from collections import namedtuple
+from flask import current_app
+from werkzeug.security import safe_join
+
+# boto3 is only needed for the S3 backend
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+    S3_AVAILABLE = True
+except ImportError:
+    S3_AVAILABLE = False
+
+# Size in bytes and modification time (epoch seconds) of a stored file
+StoredFile = namedtuple('StoredFile', 'size mtime')
+
+# Files addressed by key, read and written as chunked streams so no file is held in memory whole
+class Storage:
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    # Store a local file under a key
+    def save_file(self, key, path):
+        with open(path, 'rb') as stream:
+            self.save(key, stream)
+
+    # Copy a stored file to a local path, e.g. into a compile workspace
+    def fetch(self, key, path):
+        with open(path, 'wb') as file:
+            for chunk in self.open(key):
+                file.write(chunk)
+
+    # Path on this node's disk, None when the file lives elsewhere
+    def local_path(self, key):
+        return None
+
+# Files in a directory on the local disk, or on a volume every node mounts
+class LocalStorage(Storage):
+    def __init__(self, root, chunk_size, fanout=True):
+        super().__init__(chunk_size)
+        self.root = root
+        self.fanout = fanout
+        os.makedirs(root, exist_ok=True)
+
+    # Flat layout, every file directly in the root
+    def _flat_path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f'Invalid storage key: {key}')
+        return path
+
+    # Two levels of hash-prefix directories, e.g. 3f/a2/<key>, so no directory grows past a few thousand entries
+    def _fanout_path(self, key):
+        self._flat_path(key)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], key)
+
+    # Paths of a key in either layout, the fan-out path again last in case storage-fanout moved the file meanwhile
+    def _candidates(self, key):
+        fanout_path = self._fanout_path(key)
+        return (fanout_path, self._flat_path(key), fanout_path)
+
+    def _resolve(self, key):
+        for path in self._candidates(key):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def stat(self, key):
+        try:
+            candidates = self._candidates(key)
+        except ValueError:
+            return None
+
+        for path in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            return StoredFile(stat.st_size, stat.st_mtime)
+        return None
+
+    def open(self, key):
+        for path in self._candidates(key):
+            try:
+                file = open(path, 'rb')
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise FileNotFoundError(key)
+
+        def chunks():
+            with file:
+                for chunk in iter(lambda: file.read(self.chunk_size), b''):
+                    yield chunk
+        return chunks()
+
+    # Write next to the destination and rename, readers only ever see the complete file
+    def save(self, key, stream):
+        path = self._fanout_path(key) if self.fanout else self._flat_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, 'wb') as file:
+                shutil.copyfileobj(stream, file, self.chunk_size)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def delete(self, key):
+        for path in (self._fanout_path(key), self._flat_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def local_path(self, key):
+        return self._resolve(key)
+
+    # Keys still in the flat layout, read from the directory as it is scanned
+    def flat_keys(self):
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    yield entry.name
+
+    # Move a flat file into the fan-out layout, a rename so readers see it in one place or the other
+    def move_to_fanout(self, key):
+        path = self._fanout_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(self._flat_path(key), path)
+        except FileNotFoundError:
+            return False
+        return True
+
+# Objects in a bucket of any S3-compatible service (AWS, MinIO, Ceph), shared by every node
+class S3Storage(Storage):
+    def __init__(self, bucket, prefix, chunk_size, client_options, client=None):
+        super().__init__(chunk_size)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client_options = client_options
+        self._client = client
+        self._client_pid = os.getpid() if client else None
+
+    # boto3 clients must not cross a fork, each worker process makes its own
+    @property
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = boto3.client('s3', **self.client_options)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return StoredFile(head['ContentLength'], head['LastModified'].timestamp())
+
+    # The object is requested right away so a missing key fails here, the body is read as it is consumed
+    def open(self, key):
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key) from e
+            raise
+
+        def chunks():
+            try:
+                yield from body.iter_chunks(self.chunk_size)
+            finally:
+                body.close()
+        return chunks()
+
+    # Multipart upload straight from the stream, objects appear only once complete
+    def save(self, key, stream):
+        self.client.upload_fileobj(stream, self.bucket, self._key(key))
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+# Storage for compiled forms and signatures, picked by STORAGE_BACKEND
+def init_storage(app):
+    config = app.config
+    chunk_size = config['STORAGE_CHUNK_SIZE']
+
+    if config['STORAGE_BACKEND'] == 's3':
+        if not S3_AVAILABLE:
+            raise RuntimeError('boto3 is required for STORAGE_BACKEND=s3')
+
+        client_options = {key: value for key, value in (
+            ('endpoint_url', config['S3_ENDPOINT_URL']),
+            ('region_name', config['S3_REGION']),
+            ('aws_access_key_id', config['S3_ACCESS_KEY_ID']),
+            ('aws_secret_access_key', config['S3_SECRET_ACCESS_KEY'])
+        ) if value}
+
+        stores = {
+            'forms': S3Storage(config['S3_BUCKET'], config['S3_FORM_PREFIX'], chunk_size, client_options),
+            'signatures': S3Storage(config['S3_BUCKET'], config['S3_SIGNATURE_PREFIX'], chunk_size, client_options)
+        }
+    else:
+        stores = {
+            'forms': LocalStorage(config['FORM_FOLDER'], chunk_size, config['STORAGE_FANOUT']),
+            'signatures': LocalStorage(config['UPLOAD_FOLDER'], chunk_size, config['STORAGE_FANOUT'])
+        }
+
+    app.extensions['storage'] = stores
+
+def get_storage(name):
+    return current_app.extensions['storage'][name]
+
+# Storage key of a signature, form data written before the storage backend holds a full path
+def signature_key(value):
+    return os.path.basename(value.replace("\\", "/"))
@@ -0,0 +1,80 @@
+import hashlib, tempfile
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Leading bytes of the image formats a signature may be, whatever the extension says
+MAGIC_BYTES = {
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'\xff\xd8\xff': 'JPEG'
+}
+SNIFF_LENGTH = max(len(magic) for magic in MAGIC_BYTES)
+
+def sniff(head):
+    for magic, kind in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+# Spool for one uploaded file, filled by the form parser as the body arrives: counts bytes against a budget,
+# sniffs the format from the first bytes, hashes what it keeps and writes to disk in fixed-size chunks
+class UploadStream:
+    def __init__(self, budget, chunk_size):
+        self.file = tempfile.TemporaryFile()
+        self.budget = budget
+        self.chunk_size = chunk_size
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+        # PNG or JPEG once sniffed, False when the upload is neither and its bytes are dropped
+        self.kind = None
+        self._head = b''
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.budget:
+            raise RequestEntityTooLarge(f'Uploaded files may be at most {self.budget} bytes.')
+
+        if self.kind is None and len(self._head) < SNIFF_LENGTH:
+            self._head += bytes(data[:SNIFF_LENGTH - len(self._head)])
+            if len(self._head) == SNIFF_LENGTH:
+                self.kind = sniff(self._head) or False
+
+        if self.kind is False:
+            return len(data)
+
+        self.sha256.update(data)
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self.file.write(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+
+        return len(data)
+
+    # The parser seeks back to the start once the part is complete
+    def _finish(self):
+        if self._buffer:
+            self.file.write(self._buffer)
+            self._buffer.clear()
+        if self.kind is None:
+            self.kind = sniff(self._head) or False
+
+    def seek(self, *args):
+        self._finish()
+        return self.file.seek(*args)
+
+    def read(self, *args):
+        self._finish()
+        return self.file.read(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+# Request whose file uploads go through UploadStream instead of Werkzeug's in-memory spool
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        budget = current_app.config['UPLOAD_MAX_BYTES']
+        if content_length and content_length > budget:
+            raise RequestEntityTooLarge(f'Uploaded files may be at most {budget} bytes.')
+
+        return UploadStream(budget, current_app.config['UPLOAD_CHUNK_SIZE'])
@@ -0,0 +1,99 @@
+"""Baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 20:19:53.417224
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+# Databases created by db.create_all before migrations existed already have these tables
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if _has_table('users'):
+        return
+
+    # organizational_units and users reference each other, the manager key is added once both exist
+    op.create_table('organizational_units',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('manager_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['parent_id'], ['organizational_units.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('roles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=True),
+    sa.Column('description', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('azure_id', sa.String(length=100), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('email', sa.String(length=100), nullable=True),
+    sa.Column('active', sa.Boolean(), nullable=True),
+    sa.Column('unit_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['unit_id'], ['organizational_units.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('azure_id')
+    )
+    with op.batch_alter_table('organizational_units', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_organizational_units_manager_id', 'users', ['manager_id'], ['id'])
+
+    op.create_table('requests',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('time', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.Column('request_type', sa.Enum('FERPA', 'INFO', 'MEDICAL', 'DROP', name='requesttype'), nullable=False),
+    sa.Column('current_approver_id', sa.Integer(), nullable=True),
+    sa.Column('current_unit_id', sa.Integer(), nullable=True),
+    sa.Column('delegated_to_id', sa.Integer(), nullable=True),
+    sa.Column('pdf_link', sa.String(length=100), nullable=False),
+    sa.Column('sig_link', sa.String(length=100), nullable=True),
+    sa.Column('form_data', sa.JSON(), nullable=True),
+    sa.Column('modified_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['current_approver_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['current_unit_id'], ['organizational_units.id'], ),
+    sa.ForeignKeyConstraint(['delegated_to_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('user_roles',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('role_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'role_id')
+    )
+
+
+def downgrade():
+    op.drop_table('user_roles')
+    op.drop_table('requests')
+
+    # Break the units/users cycle, SQLite does not enforce it and cannot drop the key in place
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        for foreign_key in sa.inspect(bind).get_foreign_keys('organizational_units'):
+            if foreign_key['referred_table'] == 'users':
+                op.drop_constraint(foreign_key['name'], 'organizational_units', type_='foreignkey')
+
+    op.drop_table('users')
+    op.drop_table('roles')
+    op.drop_table('organizational_units')
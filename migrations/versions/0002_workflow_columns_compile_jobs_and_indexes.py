@@ -0,0 +1,90 @@
+"""Workflow columns, compile jobs and indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 20:19:55.014566
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+# db.create_all may already have created part of this schema, only add what is missing
+def _has_table(name):
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_column(table, name):
+    return any(column['name'] == name for column in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def _has_index(table, name):
+    return any(index['name'] == name for index in sa.inspect(op.get_bind()).get_indexes(table))
+
+
+REQUEST_INDEXES = {
+    'ix_requests_approver_delegated_status': ['current_approver_id', 'delegated_to_id', 'status'],
+    'ix_requests_delegated_status': ['delegated_to_id', 'status'],
+    'ix_requests_unit_status_time': ['current_unit_id', 'status', 'time'],
+    'ix_requests_user_time': ['user_id', 'time', 'id'],
+}
+
+
+def upgrade():
+    if not _has_table('compile_jobs'):
+        op.create_table('compile_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('request_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=10), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['request_id'], ['requests.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('compile_jobs', schema=None) as batch_op:
+            batch_op.create_index('ix_compile_jobs_request_status', ['request_id', 'status'], unique=False)
+            batch_op.create_index('ix_compile_jobs_status_priority', ['status', 'priority', 'id'], unique=False)
+
+    with op.batch_alter_table('requests', schema=None) as batch_op:
+        if not _has_column('requests', 'render_status'):
+            batch_op.add_column(sa.Column('render_status', sa.String(length=10), server_default='ready', nullable=False))
+        batch_op.alter_column('pdf_link',
+               existing_type=sa.String(length=100),
+               nullable=True)
+        for name, columns in REQUEST_INDEXES.items():
+            if not _has_index('requests', name):
+                batch_op.create_index(name, columns, unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        if not _has_column('users', 'perm_version'):
+            batch_op.add_column(sa.Column('perm_version', sa.Integer(), server_default='0', nullable=False))
+        if not _has_index('users', 'ix_users_unit_active'):
+            batch_op.create_index('ix_users_unit_active', ['unit_id', 'active'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_unit_active')
+        batch_op.drop_column('perm_version')
+
+    with op.batch_alter_table('requests', schema=None) as batch_op:
+        for name in REQUEST_INDEXES:
+            batch_op.drop_index(name)
+        batch_op.alter_column('pdf_link',
+               existing_type=sa.String(length=100),
+               nullable=False)
+        batch_op.drop_column('render_status')
+
+    op.drop_table('compile_jobs')
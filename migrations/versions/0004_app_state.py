@@ -0,0 +1,31 @@
+"""App state markers for flask bootstrap
+
+Revision ID: 0004
+Revises: 0002
+Create Date: 2026-10-18 21:48:30.502117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('app_state'):
+        return
+
+    op.create_table('app_state',
+    sa.Column('key', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('app_state')
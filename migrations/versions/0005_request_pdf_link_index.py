@@ -0,0 +1,29 @@
+"""Index requests by PDF for download checks
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 22:20:41.730954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if any(index['name'] == 'ix_requests_pdf_link' for index in sa.inspect(op.get_bind()).get_indexes('requests')):
+        return
+
+    with op.batch_alter_table('requests', schema=None) as batch_op:
+        batch_op.create_index('ix_requests_pdf_link', ['pdf_link'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('requests', schema=None) as batch_op:
+        batch_op.drop_index('ix_requests_pdf_link')
@@ -0,0 +1,55 @@
+import pytest
+from app import create_app
+from app.config import Config
+from app.models import db
+from app.utils.db_utils import bootstrap_database
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SECRET_KEY = 'test'
+        WTF_CSRF_ENABLED = False
+        SESSION_TYPE = 'memory'
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'app.db'}"
+        UPLOAD_FOLDER = str(tmp_path / 'signatures')
+        FORM_FOLDER = str(tmp_path / 'forms')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        bootstrap_database()
+        db.session.remove()
+
+    yield app
+
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+# Signs the client in as a new user with the given roles
+@pytest.fixture
+def login(app, client):
+    from app.models import OrganizationalUnit, Role, User
+
+    def login(azure_id='test-user', roles=('user',), unit_name=None):
+        with app.app_context():
+            unit = OrganizationalUnit.query.filter_by(name=unit_name).one() if unit_name else None
+            user = User(azure_id=azure_id, name='Test User', email=f'{azure_id}@example.test', unit=unit,
+                        roles=[Role.query.filter_by(name=name).one() for name in roles])
+            db.session.add(user)
+            db.session.commit()
+
+        with client.session_transaction() as session:
+            session['user'] = {'sub': azure_id, 'name': 'Test User'}
+            session['logged_in'] = True
+
+        return client
+    return login
+
+# Signed in as a new user with the user role
+@pytest.fixture
+def logged_in_client(login):
+    return login()
@@ -0,0 +1,86 @@
+import io
+import pytest
+from app.models import CompileJob, OrganizationalUnit, Request, RequestType, Role, User, db
+from app.utils import compile_queue
+from app.utils.compile_queue import claim_next_job, enqueue_compile, run_job
+from app.utils.storage import get_storage
+
+# Renders instantly: stores a PDF named after the form data it was given
+@pytest.fixture
+def queue_app(app, monkeypatch):
+    renders = []
+
+    def render(data, priority):
+        pdf_link = f"drop_form_{data['NAME']}.pdf"
+        get_storage('forms').save(pdf_link, io.BytesIO(b'%PDF-'))
+        renders.append(data['NAME'])
+        return pdf_link
+
+    monkeypatch.setattr(compile_queue, 'GENERATORS', {RequestType.DROP: render})
+    monkeypatch.setattr(compile_queue, 'cached_pdf', lambda template_name, data: None)
+
+    with app.app_context():
+        app.renders = renders
+        yield app
+
+@pytest.fixture
+def req(queue_app):
+    user = User(azure_id='student', name='Student', roles=[Role.query.filter_by(name='user').first()])
+    unit = OrganizationalUnit.query.filter_by(name='Advising').one()
+    req = Request(user=user, status='pending', request_type=RequestType.DROP, form_data={'NAME': 'first'}, current_unit_id=unit.id)
+    db.session.add(req)
+    enqueue_compile(req)
+    db.session.commit()
+    return req
+
+def _edit(req, name):
+    req.form_data = {'NAME': name}
+    enqueue_compile(req)
+    db.session.commit()
+
+def test_edit_hides_the_stale_pdf(queue_app, req):
+    run_job(claim_next_job('worker'))
+    assert req.render_status == 'ready'
+    assert req.pdf_link == 'drop_form_first.pdf'
+
+    _edit(req, 'second')
+    assert req.render_status == 'queued'
+    assert req.pdf_link is None
+
+def test_edit_during_compile_with_a_newer_job_is_not_queued_twice(queue_app, req, monkeypatch):
+    first = claim_next_job('worker-1')
+
+    # Edited while the first job compiles, and a second worker starts on the new job
+    render = compile_queue.GENERATORS[RequestType.DROP]
+    def edit_then_render(data, priority):
+        _edit(req, 'second')
+        claim_next_job('worker-2')
+        req.render_status = 'compiling'
+        db.session.commit()
+        return render(data, priority)
+    monkeypatch.setitem(compile_queue.GENERATORS, RequestType.DROP, edit_then_render)
+
+    run_job(first)
+    assert CompileJob.query.filter_by(request_id=req.id).count() == 2
+    assert CompileJob.query.filter_by(request_id=req.id, status='queued').count() == 0
+    assert req.pdf_link is None
+
+def test_edit_during_compile_without_a_job_is_queued(queue_app, req, monkeypatch):
+    job = claim_next_job('worker')
+
+    # Changed behind the queue's back, e.g. by a script
+    render = compile_queue.GENERATORS[RequestType.DROP]
+    def edit_then_render(data, priority):
+        Request.query.filter_by(id=req.id).update({'form_data': {'NAME': 'second'}})
+        db.session.commit()
+        return render(data, priority)
+    monkeypatch.setitem(compile_queue.GENERATORS, RequestType.DROP, edit_then_render)
+
+    run_job(job)
+    assert req.render_status == 'queued'
+    assert req.pdf_link is None
+
+    run_job(claim_next_job('worker'))
+    assert req.render_status == 'ready'
+    assert req.pdf_link == 'drop_form_second.pdf'
+    assert queue_app.renders == ['first', 'second']
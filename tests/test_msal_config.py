@@ -0,0 +1,101 @@
+import base64, json, time
+from functools import partial
+from urllib.parse import urlparse
+import pytest
+from app import msal_config
+from app.models import User
+
+AUTHORITY = 'https://login.example.test/tenant'
+CLIENT_ID = 'client-id'
+
+def _encode(part):
+    return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b'=').decode()
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self.headers = {'Content-Type': 'application/json'}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f'HTTP {self.status_code}')
+
+# Stand-in for the identity provider, answers MSAL's HTTP calls and records them
+class FakeAuthority:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        self.calls.append(('GET', url))
+        if url.endswith('/.well-known/openid-configuration'):
+            return FakeResponse({
+                'authorization_endpoint': f'{AUTHORITY}/oauth2/v2.0/authorize',
+                'token_endpoint': f'{AUTHORITY}/oauth2/v2.0/token',
+                'issuer': AUTHORITY
+            })
+        return FakeResponse({'error': 'not_found'}, 404)
+
+    def post(self, url, params=None, data=None, headers=None, **kwargs):
+        self.calls.append(('POST', url))
+        now = int(time.time())
+        claims = {'iss': AUTHORITY, 'sub': f"user-{data['code']}", 'aud': CLIENT_ID, 'iat': now, 'exp': now + 3600,
+                  'name': 'Test User', 'preferred_username': f"{data['code']}@example.test"}
+        return FakeResponse({
+            'token_type': 'Bearer',
+            'access_token': f"access-{data['code']}",
+            'refresh_token': f"refresh-{data['code']}",
+            'expires_in': 3600,
+            'id_token': f"{_encode({'alg': 'none'})}.{_encode(claims)}.",
+            'scope': 'User.Read'
+        })
+
+@pytest.fixture
+def authority(app, monkeypatch):
+    authority = FakeAuthority()
+    app.config.update(AUTHORITY=AUTHORITY, CLIENT_ID=CLIENT_ID, CLIENT_SECRET='secret',
+                      REDIRECT_URI='http://localhost/auth/get_token', MSAL_INSTANCE_DISCOVERY=False)
+
+    monkeypatch.setattr(msal_config, '_apps', {})
+    monkeypatch.setattr(msal_config, '_http_cache', {})
+    monkeypatch.setattr(msal_config, 'ConfidentialClientApplication',
+                        partial(msal_config.ConfidentialClientApplication, http_client=authority))
+    return authority
+
+def test_client_is_built_once_per_process(app, authority):
+    with app.app_context():
+        first = msal_config.get_msal_app()
+        second = msal_config.get_msal_app()
+
+    assert first is second
+    assert [method for method, _ in authority.calls].count('GET') == 1
+
+def test_login_round_trips_fall_to_the_code_exchange(app, client, authority):
+    assert urlparse(client.get('/auth/login').location).path == '/tenant/oauth2/v2.0/authorize'
+    discovery = len(authority.calls)
+
+    for code in ('a', 'b'):
+        authority.calls.clear()
+        client.get('/auth/login')
+        response = client.get(f'/auth/get_token?code={code}')
+
+        assert response.status_code == 302
+        assert authority.calls == [('POST', f'{AUTHORITY}/oauth2/v2.0/token')]
+
+    assert discovery == 1
+    with app.app_context():
+        assert {user.azure_id for user in User.query} == {'user-a', 'user-b'}
+
+def test_user_tokens_are_not_kept(app, client, authority):
+    client.get('/auth/get_token?code=a')
+
+    with app.app_context():
+        cache = msal_config.get_msal_app().token_cache
+        for kind in (cache.CredentialType.ACCESS_TOKEN, cache.CredentialType.REFRESH_TOKEN,
+                     cache.CredentialType.ID_TOKEN, cache.CredentialType.ACCOUNT):
+            assert list(cache.search(kind)) == []
+
+def test_failed_code_exchange_is_rejected(client, authority, monkeypatch):
+    monkeypatch.setattr(authority, 'post', lambda *args, **kwargs: FakeResponse({'error': 'invalid_grant'}, 400))
+
+    assert client.get('/auth/get_token?code=expired').status_code == 401
@@ -0,0 +1,62 @@
+import pytest
+from app.models import AppState, OrganizationalUnit, User, db
+from app.utils import org_tree
+from app.utils.org_tree import ORG_TREE_VERSION, get_org_tree
+
+@pytest.fixture
+def tree_app(app, monkeypatch):
+    monkeypatch.setattr(org_tree, '_tree', None)
+    app.config['ORG_TREE_TTL'] = 0
+
+    with app.app_context():
+        yield app
+
+def _stored_version():
+    return db.session.get(AppState, ORG_TREE_VERSION).value
+
+def _unit(name):
+    return OrganizationalUnit.query.filter_by(name=name).one()
+
+def test_ancestors_follow_parent_links(tree_app):
+    advising = _unit('Advising')
+    child = OrganizationalUnit(name='Peer Advising', parent_id=advising.id)
+    db.session.add(child)
+    db.session.commit()
+
+    tree = get_org_tree()
+    assert [unit.name for unit in tree.ancestors(child.id)] == ['Advising', 'Academic and Student Services']
+    assert tree.ancestors(_unit('Academic and Student Services').id) == []
+
+def test_reparenting_is_seen_at_once(tree_app):
+    child = OrganizationalUnit(name='Peer Advising', parent_id=_unit('Advising').id)
+    db.session.add(child)
+    db.session.commit()
+    assert get_org_tree().parent(child.id).name == 'Advising'
+
+    child.parent_id = _unit('Health and Wellness').id
+    db.session.commit()
+    assert get_org_tree().parent(child.id).name == 'Health and Wellness'
+
+def test_other_processes_reload_on_a_new_version(tree_app):
+    stale = get_org_tree()
+    version = _stored_version()
+
+    db.session.add(OrganizationalUnit(name='Peer Advising', parent_id=_unit('Advising').id))
+    db.session.commit()
+    assert _stored_version() != version
+
+    # A tree loaded before the change, as another process would still hold it
+    org_tree._tree = stale
+    tree = get_org_tree()
+    assert tree is not stale
+    assert tree.by_unit_name('Peer Advising') is not None
+
+def test_unrelated_changes_keep_the_tree(tree_app):
+    tree = get_org_tree()
+    version = _stored_version()
+
+    db.session.add(User(azure_id='someone', name='Someone'))
+    db.session.commit()
+
+    assert _stored_version() == version
+    assert get_org_tree() is tree
@@ -0,0 +1,43 @@
+import os, shutil
+import pytest
+from app.cli import _word_positions, _write_sample_png
+from app.utils.compile_scheduler import PRIORITY_SUBMIT
+from app.utils.overlay_renderer import OVERLAY_AVAILABLE, field_kinds, render_overlay
+from app.utils.request_utils import _compile_tex
+
+# Largest distance in points between a field in the overlay and in the TeX render, as in flask check-overlay
+TOLERANCE = 4.0
+
+pytestmark = [
+    pytest.mark.skipif(shutil.which('pdflatex') is None, reason='pdflatex is not on PATH'),
+    pytest.mark.skipif(not OVERLAY_AVAILABLE, reason='pypdf and reportlab are required for the overlay engine')
+]
+
+@pytest.mark.parametrize('name', ['ferpa', 'name_ssn_change', 'medical_withdrawal', 'student_drop'])
+def test_overlay_matches_tex(app, tmp_path, name):
+    app.config.update(OVERLAY_FOLDER=str(tmp_path / 'overlays'), LATEX_FORMAT_FOLDER=str(tmp_path / 'formats'))
+    signature = str(tmp_path / 'signature.png')
+    _write_sample_png(signature)
+
+    with app.app_context():
+        template = app.extensions['form_templates'][name]
+
+        # A distinct word for every text field, checkboxes all ticked
+        kinds = field_kinds(template)
+        data = {field: 'yes' if kinds[field] == 'checkbox' else 'X' + field.replace('_', '') for field in template.fields}
+        data['SIGNATURE'] = signature
+        words = [data[field] for field, kind in kinds.items() if kind in ('text', 'bold')]
+
+        tex_output = _compile_tex(template, data, str(tmp_path), PRIORITY_SUBMIT)
+        overlay_output = str(tmp_path / f'{name}-overlay.pdf')
+        assert os.path.exists(tex_output)
+        assert render_overlay(template, data, overlay_output)
+
+    expected = _word_positions(tex_output, words)
+    actual = _word_positions(overlay_output, words)
+    assert expected, 'no field values found in the TeX output'
+
+    for word, (x, y) in expected.items():
+        assert word in actual, f'{word} missing from the overlay'
+        distance = ((actual[word][0] - x) ** 2 + (actual[word][1] - y) ** 2) ** 0.5
+        assert distance <= TOLERANCE, f'{word} is {distance:.1f}pt away from its TeX position'
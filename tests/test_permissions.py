@@ -0,0 +1,81 @@
+import io
+import pytest
+from sqlalchemy import event
+from app.models import db
+
+# SQL statements that read users or their roles
+@pytest.fixture
+def user_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM users' in statement or 'user_roles' in statement:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+@pytest.mark.parametrize('roles, url', [
+    (('user',), '/home'),
+    (('user',), '/about'),
+    (('user',), '/user/requests/manage'),
+    (('user',), '/user/requests/ferpa'),
+    (('user',), '/user/requests/student_drop'),
+    (('manager',), '/manager/requests/manage'),
+    (('manager',), '/manager/requests/reports'),
+    (('employee',), '/employee/requests/delegated')
+])
+def test_pages_read_roles_from_the_snapshot(login, user_queries, roles, url):
+    client = login(roles=roles, unit_name='Advising')
+
+    # The first request signs the permission snapshot into the session
+    client.get('/home')
+    user_queries.clear()
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert user_queries == []
+
+@pytest.fixture
+def admin_pdf(app, login):
+    from app.models import Request, RequestType, User
+    from app.utils.storage import get_storage
+
+    client = login(azure_id='admin', roles=('admin',))
+    with app.app_context():
+        get_storage('forms').save('drop_form_admin.pdf', io.BytesIO(b'%PDF-'))
+        owner = User.query.filter_by(azure_id='admin').one()
+        req = Request(user_id=owner.id, status='pending', request_type=RequestType.DROP, form_data={},
+                      pdf_link='drop_form_admin.pdf', render_status='ready')
+        db.session.add(req)
+        db.session.commit()
+        return client, req.id
+
+def test_admin_downloads_their_own_pdf(admin_pdf):
+    client, request_id = admin_pdf
+
+    response = client.get('/download/drop_form_admin.pdf')
+    assert response.status_code == 200
+    assert response.data == b'%PDF-'
+
+    response = client.get(f'/download/request/{request_id}')
+    assert response.status_code == 302
+    assert response.location.endswith('/download/drop_form_admin.pdf')
+
+def test_admin_cannot_download_pdfs_of_others(app, admin_pdf):
+    from app.models import Request, User
+
+    client, request_id = admin_pdf
+    with app.app_context():
+        other = User(azure_id='other', name='Other')
+        db.session.add(other)
+        db.session.flush()
+        Request.query.filter_by(id=request_id).update({'user_id': other.id})
+        db.session.commit()
+
+    response = client.get('/download/drop_form_admin.pdf')
+    assert response.mimetype != 'application/pdf'
+    assert b'%PDF-' not in response.data
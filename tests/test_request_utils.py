@@ -0,0 +1,52 @@
+import hashlib, io
+import pytest
+from app.utils import request_utils
+from app.utils.request_utils import pdf_filename, signature_digest
+from app.utils.storage import get_storage
+
+DATA = {'NAME': 'Test User', 'DATE': '2026-01-01'}
+
+# Counts reads of the signature store
+@pytest.fixture
+def signatures(app, monkeypatch):
+    monkeypatch.setattr(request_utils, '_signature_digests', request_utils.OrderedDict())
+
+    with app.app_context():
+        store = get_storage('signatures')
+        reads = []
+        original = store.open
+        monkeypatch.setattr(store, 'open', lambda key: reads.append(key) or original(key))
+        yield store, reads
+
+def test_content_addressed_signature_is_never_read(signatures):
+    store, reads = signatures
+    key = hashlib.sha256(b'upload').hexdigest() + '.png'
+
+    assert signature_digest(key) == key
+    assert reads == []
+
+def test_older_signature_is_read_once(signatures):
+    store, reads = signatures
+    store.save('legacy.png', io.BytesIO(b'signature'))
+
+    assert signature_digest('legacy.png') == hashlib.sha256(b'signature').hexdigest()
+    assert signature_digest('uploads/legacy.png') == hashlib.sha256(b'signature').hexdigest()
+    assert reads == ['legacy.png']
+
+def test_missing_signature_is_not_remembered(signatures):
+    store, reads = signatures
+
+    assert signature_digest('late.png') is None
+    store.save('late.png', io.BytesIO(b'signature'))
+    assert signature_digest('late.png') == hashlib.sha256(b'signature').hexdigest()
+
+def test_render_key_follows_the_signature(signatures):
+    store, reads = signatures
+    store.save('a.png', io.BytesIO(b'first'))
+    store.save('b.png', io.BytesIO(b'second'))
+    store.save('c.png', io.BytesIO(b'first'))
+
+    names = {key: pdf_filename('ferpa', dict(DATA, SIGNATURE=key)) for key in ('a.png', 'b.png', 'c.png')}
+    assert names['a.png'] == names['c.png'] != names['b.png']
+    assert pdf_filename('ferpa', dict(DATA, SIGNATURE='a.png')) == names['a.png']
+    assert reads == ['a.png', 'b.png', 'c.png']
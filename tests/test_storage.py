@@ -0,0 +1,77 @@
+import io
+import pytest
+from app.models import Request, RequestType, User, db
+from app.utils.storage import LocalStorage, S3Storage, get_storage, init_storage
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 8
+FILENAME = 'drop_form_' + 'ab' * 32 + '.pdf'
+
+# Storage picked by STORAGE_BACKEND, S3 served by moto in place of a bucket
+@pytest.fixture(params=['local', 's3'])
+def backend(request, app, monkeypatch):
+    if request.param == 'local':
+        init_storage(app)
+        yield request.param
+        return
+
+    for name, value in (('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'), ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+
+    with moto.mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='forms')
+        app.config.update(STORAGE_BACKEND='s3', S3_BUCKET='forms', S3_REGION='us-east-1', STORAGE_CHUNK_SIZE=1024)
+        init_storage(app)
+        yield request.param
+
+def test_backend_is_the_one_configured(app, backend):
+    with app.app_context():
+        assert isinstance(get_storage('forms'), S3Storage if backend == 's3' else LocalStorage)
+
+def test_save_open_stat_exists(app, backend):
+    with app.app_context():
+        storage = get_storage('forms')
+        assert not storage.exists(FILENAME)
+        assert storage.stat(FILENAME) is None
+        with pytest.raises(FileNotFoundError):
+            storage.open(FILENAME)
+
+        storage.save(FILENAME, io.BytesIO(PDF))
+        assert storage.exists(FILENAME)
+        assert storage.stat(FILENAME).size == len(PDF)
+        assert b''.join(storage.open(FILENAME)) == PDF
+
+        # Signatures live under their own prefix or folder
+        assert not get_storage('signatures').exists(FILENAME)
+
+        storage.delete(FILENAME)
+        assert not storage.exists(FILENAME)
+
+@pytest.fixture
+def stored_pdf(app, backend, logged_in_client):
+    with app.app_context():
+        user = User.query.filter_by(azure_id='test-user').one()
+        db.session.add(Request(user_id=user.id, status='pending', request_type=RequestType.DROP, form_data={},
+                               pdf_link=FILENAME, render_status='ready'))
+        db.session.commit()
+        get_storage('forms').save(FILENAME, io.BytesIO(PDF))
+
+    return f'/download/{FILENAME}'
+
+def test_download_answers_if_none_match_with_304(logged_in_client, stored_pdf):
+    response = logged_in_client.get(stored_pdf)
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert response.headers['ETag'] == '"' + 'ab' * 32 + '"'
+
+    response = logged_in_client.get(stored_pdf, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_download_answers_range_with_206(logged_in_client, stored_pdf):
+    response = logged_in_client.get(stored_pdf, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(PDF)}'
+    assert response.data == PDF[100:200]
@@ -0,0 +1,39 @@
+import base64, io, shutil
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.utils.file_utils import save_signature
+
+FORM_URL = '/user/requests/ferpa'
+
+def _post_signature(client, size):
+    return client.post(FORM_URL, data={'name': 'Test User', 'signature': (io.BytesIO(b'\xff\xd8\xff' + b'\0' * size), 'signature.jpg')},
+                       content_type='multipart/form-data')
+
+def test_phone_photo_fits_the_default_limits(app):
+    assert app.config['UPLOAD_MAX_BYTES'] >= 10 * 1024 * 1024
+    assert app.config['MAX_CONTENT_LENGTH'] > app.config['UPLOAD_MAX_BYTES']
+
+@pytest.mark.parametrize('limits', [
+    {'UPLOAD_MAX_BYTES': 1024, 'MAX_CONTENT_LENGTH': 64 * 1024},
+    {'UPLOAD_MAX_BYTES': 64 * 1024, 'MAX_CONTENT_LENGTH': 1024}
+], ids=['file', 'body'])
+def test_oversized_upload_returns_to_the_form(app, logged_in_client, limits):
+    app.config.update(limits)
+
+    response = _post_signature(logged_in_client, 8 * 1024)
+    assert response.status_code == 302
+    assert response.location.endswith(FORM_URL)
+
+    page = logged_in_client.get(response.location)
+    assert page.status_code == 200
+    assert b'The upload is too large, files may be at most' in page.data
+
+@pytest.mark.parametrize('tool', ['IMAGEMAGICK_IDENTIFY', 'IMAGEMAGICK_CONVERT'])
+def test_missing_imagemagick_rejects_the_signature(app, tool):
+    app.config[tool] = '/nonexistent/imagemagick'
+    if tool == 'IMAGEMAGICK_CONVERT' and not shutil.which(app.config['IMAGEMAGICK_IDENTIFY']):
+        pytest.skip('identify is not on PATH')
+
+    png = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR4nGNgAAAAAgABSK+kcQAAAABJRU5ErkJggg==')
+    with app.test_request_context():
+        assert save_signature(FileStorage(io.BytesIO(png), 'signature.png')) is None